@@ -1,5 +1,4 @@
 import praw
-from prawcore.exceptions import Forbidden, NotFound
 from datetime import datetime
 
 reddit = praw.Reddit()
@@ -17,17 +16,3 @@ for i in range(10):
                 time = str(datetime.fromtimestamp(int(submission.created_utc)))
                 file.write(f"{time}\t{submission.subreddit.display_name}\n")
 
-
-# with open("blacklist.txt", "r") as file:
-#     subs = file.readlines()
-#
-# with open("blacklist_id.txt", "a") as file:
-#     for sub in subs:
-#         line = sub.strip()
-#         try:
-#             file.write(reddit.subreddit(line).name + "\n")
-#             print(line, "added")
-#         except NotFound:
-#             print(line, "not found")
-#         except Forbidden:
-#             print(line, "forbidden")
\ No newline at end of file
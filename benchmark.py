@@ -0,0 +1,155 @@
+"""Measures the API cost of the bot's operations against the offline fake Reddit.
+
+For each operation, it reports the amount of HTTP requests, the bytes sent and
+received, and the wall time. The fixed pauses of the bot ('sleep()') are skipped,
+so the time reflects only the processing and the requests.
+
+Usage:
+    python benchmark.py [--posts N] [--history N] [--messages N]
+"""
+
+import chickenbot
+import shutil
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from io import StringIO
+from os import chdir, getcwd
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+from fakereddit import FakeReddit
+from chickenmetrics import Metrics, CountingRequestor
+
+class Benchmark():
+    """Runs the operations and collects their costs."""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.results = []
+
+    def measure(self, name, operation):
+        """Run an operation and store its cost. Returns the operation's result."""
+
+        self.fake.reset_counters()
+        start = perf_counter()
+        with redirect_stdout(StringIO()):   # Hide the bot's messages
+            result = operation()
+        elapsed = perf_counter() - start
+        self.results.append((name, self.fake.requests, self.fake.bytes_sent, self.fake.bytes_received, elapsed, dict(self.fake.endpoints)))
+        return result
+
+    def report(self, verbose=False):
+        print(f"{'Operation':<36}{'Requests':>10}{'Sent':>12}{'Received':>12}{'Time (ms)':>12}")
+        print("-" * 82)
+        for name, requests, sent, received, elapsed, endpoints in self.results:
+            print(f"{name:<36}{requests:>10}{sent:>12}{received:>12}{elapsed * 1000:>12.1f}")
+            if verbose:
+                for endpoint, count in sorted(endpoints.items()):
+                    print(f"    {endpoint:<50}{count:>6}")
+
+def new_bot(fake, metrics):
+    """Start the bot on the fake Reddit."""
+
+    reddit = fake.reddit(requestor_class=CountingRequestor, requestor_kwargs={"metrics": metrics})
+    return chickenbot.ChickenBot(reddit=reddit, metrics=metrics)
+
+def filter_all(bot, submissions):
+    """Run all checks of the bot on the posts (including on the posts older than the bot's latest reply)."""
+
+    previous_reply_time = bot.previous_reply_time
+    bot.previous_reply_time = 0
+    try:
+        return [bot.submission_testing(submission) for submission in submissions]
+    finally:
+        bot.previous_reply_time = previous_reply_time
+
+class Crash(Exception):
+    """Stands for the bot being killed in the middle of an operation."""
+
+def crash(*args, **kwargs):
+    raise Crash
+
+def run(posts, history, messages, verbose):
+    fake = FakeReddit()
+    fake.seed(posts=posts, history=history, messages=messages)
+    bench = Benchmark(fake)
+    metrics = Metrics()
+    chickenbot.sleep = lambda seconds: None     # Skip the bot's fixed pauses
+
+    bot = bench.measure("ChickenBot.__init__ (cold start)", lambda: new_bot(fake, metrics))
+    bot.close()
+    bot = bench.measure("ChickenBot.__init__ (saved state)", lambda: new_bot(fake, metrics))
+
+    bench.measure("check_submissions (first cycle)", bot.check_submissions)
+    for number in range(5):
+        fake.add_submission("Why did the chicken cross the road?", f"newcomer{number}", "sub0", time())
+    bench.measure("check_submissions (5 new posts)", bot.check_submissions)
+    bench.measure("check_submissions (no new posts)", bot.check_submissions)
+    for number in range(2):
+        fake.add_submission("Why did the chicken cross the road?", f"refused{number}", "banned0", time())
+    bench.measure("check_submissions (2 refused replies)", bot.check_submissions)
+    fake.add_submission("Why did the chicken cross the road?", "refused2", "banned0", time())
+    bench.measure("check_submissions (blacklisted sub)", bot.check_submissions)
+
+    # Filtering the search results must not make any request (it only uses the listing's data)
+    results = list(bot.subreddit.search(bot.queries[0], sort="new", limit=100))
+    bench.measure(f"submission_testing ({len(results)} posts)", lambda: filter_all(bot, results))
+    assert bench.results[-1][1] == 0, "Filtering the search results made requests to Reddit"
+
+    bench.measure("private_messages", bot.private_messages)
+    bench.measure("private_messages (no new messages)", bot.private_messages)
+    assert bench.results[-1][1] == 1, "The unread replies to the bot's comments were paged through"
+
+    bot.stream_subreddits = "sub2+sub3"
+    bench.measure("check_stream (first check)", bot.check_stream)
+    bench.measure("check_stream (idle)", bot.check_stream)
+    for number in range(3):
+        fake.add_submission("Why did the chicken cross the road?", f"streamer{number}", "sub2", time())
+    bench.measure("check_stream (3 new posts)", bot.check_stream)
+
+    post = fake.add_submission("Why did the chicken cross the road?", "lonely_poster", "sub1", time())
+    submission = bot.reddit.submission(post["id"])
+    submission._fetch()
+    bench.measure("make_reply", lambda: bot.make_reply(submission))
+
+    # A crash right after posting a reply: the next start finds the comment and records the reply once
+    post = fake.add_submission("Why did the chicken cross the road?", "unlucky_poster", "sub1", time())
+    submission = bot.reddit.submission(post["id"])
+    submission._fetch()
+    counter = bot.reply_counter
+    bot.finish_reply = crash
+    try:
+        with redirect_stdout(StringIO()):
+            bot.make_reply(submission)
+    except Crash:
+        pass
+    bot.close()
+    bot = bench.measure("ChickenBot.__init__ (crashed reply)", lambda: new_bot(fake, metrics))
+    assert bot.reply_counter == counter + 1, "The interrupted reply was not counted exactly once"
+    assert bot.state.get(bot.reply_checkpoint_key) is None, "The interrupted reply was not logged"
+
+    bench.report(verbose)
+    if verbose:
+        print(f"\n{metrics.render()}")
+    bot.close()
+    fake.close()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Measure the API cost of ChickenBot's operations on a fake Reddit.")
+    parser.add_argument("--posts", type=int, default=300, help="amount of submissions with the question (default: 300)")
+    parser.add_argument("--history", type=int, default=50, help="amount of previous replies of the bot (default: 50)")
+    parser.add_argument("--messages", type=int, default=20, help="amount of unread removal requests (default: 20)")
+    parser.add_argument("--verbose", action="store_true", help="also show the requests per endpoint and the bot's metrics")
+    args = parser.parse_args()
+
+    # Run on a temporary folder, so the bot's files do not mix with the real ones
+    source = Path(__file__).resolve().parent
+    previous_folder = getcwd()
+    with TemporaryDirectory() as folder:
+        for file_name in ("responses.txt", "blacklist.txt"):
+            shutil.copy(source / file_name, folder)
+        chdir(folder)
+        try:
+            run(args.posts, args.history, args.messages, args.verbose)
+        finally:
+            chdir(previous_folder)
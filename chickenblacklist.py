@@ -0,0 +1,181 @@
+"""Subreddits where the bot does not reply.
+
+The blacklist can be checked from the command line, which shows each subreddit's name and fullname:
+    python chickenblacklist.py
+"""
+
+import praw
+from pathlib import Path
+from prawcore.exceptions import PrawcoreException
+from chickenclock import time
+
+class Blacklist():
+    """Subreddits where the bot does not reply, from two sources:
+        - the blacklist file, with one subreddit per line (either its name or its
+          fullname 't5_...'). The file is read again whenever it is modified.
+        - the subreddits learned by the bot: after 'refusal_limit' replies refused by
+          Reddit (HTTP 403), the subreddit is blacklisted for 'ttl' seconds. Then the
+          bot tries it again, and a single refusal blacklists it for another period.
+
+    The names and fullnames of the subreddits are looked up on Reddit only once,
+    and kept on the saved state, along with the learned subreddits (so they are
+    shared between the bot processes).
+
+    The names are also used for excluding the subreddits from the search queries,
+    so Reddit does not return their posts at all.
+    """
+
+    def __init__(self, state, reddit, path="blacklist.txt", refusal_limit=2, ttl=30*86400):
+        self.state = state
+        self.reddit = reddit
+        self.path = Path(path)
+        self.refusal_limit = refusal_limit
+        self.ttl = ttl
+        self.file_version = None    # Modification time of the loaded file
+
+        self.fullnames = set()      # Fullnames of the subreddits on the file
+        self.names = set()          # Names of the subreddits on the file (in lowercase)
+        self.query_names = []       # Names of the subreddits on the file, in the same order as the file
+        self.learned = dict()       # Fullname: {"name", "refusals", "until"}
+        self.refresh()
+
+    def refresh(self):
+        """Read again the learned subreddits, and the file if it was modified since it was loaded."""
+
+        self.learned = self.state.get("blacklist_learned", dict())
+        try:
+            version = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            version = None
+        if version == self.file_version:
+            return
+        self.file_version = version
+
+        entries = []
+        if version is not None:
+            with open(self.path, "r", encoding="utf-8") as blacklist_file:
+                entries = [line.strip() for line in blacklist_file if line.strip()]
+        self.load(entries)
+
+    def load(self, entries):
+        """Use the subreddits of the file's lines (names or fullnames).
+        The new sets are built apart and then swapped in, so the other threads never see them half filled."""
+
+        cache = self.lookup(entries)
+        fullnames = set()
+        names = set()
+        query_names = []
+        for entry in entries:
+            found = cache.get(entry.lower(), False)
+            if found is None:
+                continue    # The subreddit does not exist
+            fullname, name = found or (None, None)
+            if entry.startswith("t5_"):
+                fullname = entry
+            elif name is None:
+                name = entry    # A name that could not be looked up is still matched by the name
+            if fullname is not None:
+                fullnames.add(fullname)
+            if name is not None:
+                names.add(name.lower())
+                query_names.append(name)
+        self.fullnames, self.names, self.query_names = fullnames, names, query_names
+
+    def lookup(self, entries):
+        """Get the fullname and name of the subreddits on a list of names or fullnames.
+
+        Returns a dictionary of the entries (in lowercase) and their (fullname, name),
+        or None for the subreddits that do not exist. Only the entries that are not
+        on the saved state are looked up on Reddit (with up to 100 subreddits per request)."""
+
+        cache = self.state.get("subreddit_lookup", dict())
+        missing = list(dict.fromkeys(entry.lower() for entry in entries if entry.lower() not in cache))
+        if not missing:
+            return cache
+
+        try:
+            fullnames = [entry for entry in missing if entry.startswith("t5_")]
+            names = [entry for entry in missing if not entry.startswith("t5_")]
+            found = dict()
+            if fullnames:
+                found.update({subreddit.fullname: subreddit for subreddit in self.reddit.info(fullnames=fullnames)})
+            if names:
+                found.update({subreddit.display_name.lower(): subreddit for subreddit in self.reddit.info(subreddits=names)})
+        except PrawcoreException as error:
+            print("Warning: could not look up the blacklisted subreddits:", error)
+            return cache
+
+        new_entries = dict()
+        for entry in missing:
+            subreddit = found.get(entry)
+            new_entries[entry] = (subreddit.fullname, subreddit.display_name) if subreddit is not None else None
+        return self.state.update("subreddit_lookup", lambda saved: {**(saved or dict()), **new_entries})
+
+    def blocks(self, fullname, name):
+        """Whether the bot should not reply on a subreddit (by its fullname and name)."""
+
+        if (fullname in self.fullnames) or (name.lower() in self.names):
+            return True
+        learned = self.learned.get(fullname)
+        return (learned is not None) and (learned["until"] > time())
+
+    def refused(self, fullname, name):
+        """Count a reply refused by Reddit on a subreddit.
+        Returns whether the subreddit got blacklisted."""
+
+        def add_refusal(saved):
+            learned = saved or dict()
+            entry = learned.setdefault(fullname, {"name": name, "refusals": 0, "until": 0})
+            entry["refusals"] += 1
+            if entry["refusals"] >= self.refusal_limit:
+                entry["until"] = time() + self.ttl
+                entry["refusals"] = self.refusal_limit - 1  # A single refusal blacklists it again after the period
+            return learned
+
+        self.learned = self.state.update("blacklist_learned", add_refusal)
+        return self.learned[fullname]["until"] > time()
+
+    def accepted(self, fullname):
+        """Forget the refusals of a subreddit, after a reply was accepted on it."""
+
+        if fullname in self.learned:
+            self.learned = self.state.update("blacklist_learned", lambda saved: {
+                key: entry for key, entry in (saved or dict()).items() if key != fullname
+            })
+
+    def exclude_from(self, query, max_length=512):
+        """Add to a search query the exclusion of as many blacklisted subreddits as
+        the query's maximum length allows (the learned subreddits come first).
+
+        The query is put between parentheses, so the exclusions apply to all of
+        its alternatives when it joins the questions of several rules with OR."""
+
+        now = time()
+        learned = sorted((entry for entry in self.learned.values() if entry["until"] > now), key=lambda entry: -entry["until"])
+        names = list(dict.fromkeys([entry["name"] for entry in learned] + self.query_names))
+
+        exclusions = ""
+        for name in names:
+            exclusion = f" NOT subreddit:{name}"
+            if len(query) + len("()") + len(exclusions) + len(exclusion) > max_length:
+                break
+            exclusions += exclusion
+        return f"({query}){exclusions}" if exclusions else query
+
+if __name__ == "__main__":
+    from chickenstate import StateStore
+
+    state = StateStore()
+    blacklist = Blacklist(state, praw.Reddit())
+    cache = state.get("subreddit_lookup", dict())
+    for entry, found in cache.items():
+        fullname, name = found or ("-", "-")
+        blocked = (fullname in blacklist.fullnames) or (name.lower() in blacklist.names)
+        if blocked:
+            print(f"{fullname}\tr/{name}")
+    for entry in sorted(set(entry for entry, found in cache.items() if found is None)):
+        print(f"{entry}\tnot found")
+    for fullname, entry in blacklist.learned.items():
+        until = "blacklisted" if entry["until"] > time() else "not blacklisted"
+        print(f"{fullname}\tr/{entry['name']}\t{entry['refusals']} refusals, {until}")
+    state.close()
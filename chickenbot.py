@@ -1,29 +1,67 @@
 import praw
-import pickle
 import re
+import json
+import pickle
+import asyncio
 from prawcore.exceptions import Forbidden, PrawcoreException
-from praw.exceptions import ClientException, RedditAPIException
+from praw.exceptions import RedditAPIException
 from traceback import format_exc
-from collections import deque
-from random import shuffle
-from time import sleep
-from datetime import datetime, timedelta
-from os import get_terminal_size
+from os import getpid, replace
 from pathlib import Path
-from threading import Thread
+from shutil import get_terminal_size
+from threading import Thread, Lock, Event
+from multiprocessing import Process
+from collections import OrderedDict
+from heapq import heapify, heappush, heappop
 from signal import signal, SIGINT
 from urllib.parse import quote
+from argparse import ArgumentParser
+from chickenstate import StateStore
+from chickenschedule import PollScheduler
+from chickenmetrics import Metrics, CountingRequestor
+from chickencooldown import CooldownIndex
+from chickenresponses import ResponsePool
+from chickenrules import load_rules, RuleMatcher, build_queries
+from chickenlog import EventLog, log_signature, read_records, read_replies
+from chickenblacklist import Blacklist
+from chickenretry import RetryPolicy
+from chickenclock import sleep, time, utc_now
+import chickenclock
+
+DEFAULT_QUESTION = "why did the chicken cross the road"
 
 class ChickenBot():
     
     def __init__(self,
         subreddit = "all",
-        question = "why did the chicken cross the road",
-        wait_interval = 3600,   # Time in seconds for searching new posts
+        question = DEFAULT_QUESTION,    # Question answered when there is no rules file
+        rules_file = "rules.json",  # File with the questions and their answers (see 'chickenrules.Rule')
+        stream_subreddits = None,   # Subreddits to be streamed for new posts, joined by "+" (None to disable)
+        stream_wait = 60,       # Longest time in seconds between checks of the stream when no posts are coming
+        wait_interval = 3600,   # Time in seconds for searching new posts (before the bot learns how often the question comes)
+        min_wait = 600,         # Shortest time in seconds between searches (when the question is coming often)
+        max_wait = 7200,        # Longest time in seconds between searches (when the question is not coming)
         user_cooldown = 86400,  # Time in seconds for when an user can get a new reply from the bot
         user_refresh = 1800,    # Minimum time in seconds for cleaning the replied users list
-        message_wait = 900,     # Minimum time in seconds for checking new private messages
+        message_min_wait = 60,  # Shortest time in seconds between checks of the inbox (right after a reply or a removal request)
+        message_max_wait = 1800,    # Longest time in seconds between checks of the inbox (when no messages are coming)
         counter_start = 0,      # The starting value of the bot replies counter
+        state_file = "chickenbot_state.db", # Database where the bot's state is saved between sessions
+        state_max_age = 86400,  # Time in seconds for when the saved state needs to be reconciled with Reddit
+        reddit = None,          # Reddit instance to be used (by default, a new one from the settings on 'praw.ini')
+        metrics = None,         # Metrics collection (by default, a new one; an external Reddit instance should count its requests on it through 'CountingRequestor')
+        metrics_file = "metrics.prom",  # File where the metrics are written after each check (None to disable)
+        metrics_port = None,    # Port for serving the metrics over HTTP (None to disable)
+        shard = 0,              # Number of this process, when the work is split between several bot processes
+        shards = 1,             # Amount of bot processes sharing the work (and the saved state)
+        site = None,            # Section of 'praw.ini' with the account's settings (None for the default)
+        inbox = True,           # Whether this process handles the removal requests on the inbox
+        retry_attempts = 4,     # Most times a search or inbox check is tried when Reddit has a temporary problem
+        retry_delay = 5,        # Wait in seconds before the first retry (it doubles on each retry, with some randomness)
+        watchdog_interval = 30, # Time in seconds between the checks of the listeners by the watchdog
+        stuck_timeout = 1800,   # Time in seconds for when a listener still on the same check is reported as stuck
+        heartbeat_file = "heartbeat.json",  # File rewritten by the watchdog with the times of the listeners' checks (None to disable)
+        seed = None,            # Seed for the order of the responses (None for a random order; the replays set it, so they are repeatable)
     ):
         """The bot works by searching each 1 hour (default) for the question in the title
         of posts, and then checking if the post author did not get a reply from the bot in
@@ -33,433 +71,1078 @@ class ChickenBot():
         The search is made this way, instead of constantly checking for a stream of new
         submissions, because the default question do not come that often (2 to 3 times a
         day, on average). Thus continuously checking for all new posts would be a waste of
-        resources (especially bandwidth)."""
+        resources (especially bandwidth).
+        
+        Several questions can be answered, each with its own responses, by listing
+        them on the rules file. Their searches are merged into as few queries as
+        possible, and each title is matched against all questions at once.
+        
+        For high-traffic subreddits, the new posts can also be streamed, so the bot
+        replies within seconds. The stream runs alongside the hourly search, and a
+        post found by both is only processed once.
+        
+        The time between searches adapts to how often the question has been found at
+        that time of the day, and it is also extended when the API rate limit is low.
+        
+        The bot's state is saved to a local database, so it can resume from it on the
+        next start. Reddit is only used for rebuilding the state when the database is
+        missing or older than 'state_max_age'.
+        
+        The work can be split between several processes (shards), each one with its own
+        queries and streamed subreddits, and possibly its own Reddit account. They share
+        the same database, where each post is claimed before getting a reply, so a post
+        or an author on cooldown never gets two replies.
+        
+        A search or inbox check that fails because of a temporary problem on Reddit is
+        retried within seconds, instead of waiting for the next check. A watchdog restarts
+        the listeners that stopped, reports the ones that got stuck, and writes a heartbeat
+        file. The reply being made is checkpointed on the database, so a crash while
+        replying neither posts the reply twice nor leaves it out of the logs."""
         
+        # Metrics of the bot's operation
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics_file = metrics_file
+        self.describe_metrics()
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port)
+        
+        # Retries of the operations that fail because of a temporary problem
+        self.retry = RetryPolicy(attempts=retry_attempts, base_delay=retry_delay, metrics=self.metrics)
+
         # Open Reddit instance
         print("Starting up ChickenBot...")
         print("Logging in Reddit... ", end="", flush=True)
-        self.reddit = praw.Reddit()
+        self.reddit = reddit if reddit is not None else praw.Reddit(
+            site,
+            requestor_class = CountingRequestor,            # Count the requests made to Reddit
+            requestor_kwargs = {"metrics": self.metrics},
+        )
         self.reddit.validate_on_submit = True
         self.subreddit = self.reddit.subreddit(subreddit)
         print("Finished")
 
         # Question
-        self.question = question.lower()
-        self.query = f"(title:{self.question})"
-        self.previous_post = ""     # Last post which had the question on the title
-        self.previous_reply_time = datetime.utcnow()    # Time of the latest bot reply
+        self.rules = load_rules(rules_file, question)   # Questions and how to answer them
+        self.matcher = RuleMatcher(self.rules)          # Finds the question on a title
+        self.shard = shard
+        self.shards = shards
+        self.worker = f"{shard}/{shards}"               # Name of this process on the claims
+        self.queries = build_queries(self.rules)[shard::shards]     # Search queries of this shard
+        self.cursors = dict()   # Last post found by each query: its fullname and creation time (Unix epoch)
+        self.processed = OrderedDict()  # Fullnames of the latest posts processed (by either the search or the stream)
+        self.processed_lock = Lock()
+        self.reply_lock = Lock()        # Only one reply is made at a time
+
+        # Stream of new posts (optional)
+        if stream_subreddits:
+            # Each shard streams its own part of the subreddits
+            stream_subreddits = "+".join(stream_subreddits.split("+")[shard::shards]) or None
+        self.stream_subreddits = stream_subreddits
+        self.stream = None              # Generator of the new posts (created on the first check)
+        self.stream_wait = stream_wait
+        self.stream_backoff = 1         # Current time in seconds between checks of the stream
+        self.previous_reply_time = time()   # Time of the latest bot reply (Unix epoch)
         self.wait = wait_interval   # Time to wait between checks for new posts
 
+        # Open the saved state
+        print("Loading the saved state... ", end="", flush=True)
+        self.state = StateStore(state_file)
+        state_is_fresh = self.state.existed and (self.state.age() < state_max_age)
+        print("Finished" if state_is_fresh else "Saved state is missing or stale")
+
+        # Load the search cursor (the newest post seen by the previous searches)
+        cursor_loaded = self.load_cursor()
+
+        # Scheduler of the searches, with the times of the posts found on the previous sessions
+        self.scheduler = PollScheduler(base_interval=wait_interval, min_interval=min_wait, max_interval=max_wait)
+        self.scheduler.record_hits(self.state.get(self.worker_key("arrival_times"), []))
+
         # Get latest users who the bot replied to
-        print("Looking for the latest replied users... ", end="", flush=True)
-        self.replied_users = dict()                             # Dictionary of users and the time of the last bot reply
-        self.user_cooldown = timedelta(seconds=user_cooldown)   # How long to wait before user can get another reply (default: 1 day)
-        my_comments = self.reddit.user.me().comments.new()      # Most recent comments of the bot
-        self.user_refresh = timedelta(seconds=user_refresh)     # Minimum time to refresh the replied users list
-        
-        for count, comment in enumerate(my_comments):
-            current_time = datetime.utcnow()                               # Time now
-            comment_time = datetime.fromtimestamp(comment.created_utc)  # Time of the bot reply
-            comment_age = current_time - comment_time                   # Difference between the two times
-            if count == 0:
-                self.previous_post = comment.submission.name            # Latest submission replied by bot
-                self.previous_reply_time = datetime.fromtimestamp(      # Time of the latest bot reply
-                    comment.created_utc
-                )
+        self.replied_users = CooldownIndex()    # Users and the time when they can get another reply
+        self.user_cooldown = user_cooldown      # How long to wait before user can get another reply (default: 1 day)
+        self.user_refresh = user_refresh        # Minimum time to refresh the replied users list
 
-            if comment_age < self.user_cooldown:
-                # Store the user ID and comment time if the bot reply was made before the cooldown period
-                replied_user = comment.submission.author.id
-                self.replied_users.update({replied_user: comment_time})
+        self.state.prune_replied_users(self.user_cooldown)  # (the table only keeps the users still on cooldown)
+        if state_is_fresh:
+            self.load_replied_users()
+        else:
+            self.reconcile_replied_users(cursor_loaded)
         
-        self.last_refresh = datetime.utcnow()  # Store the time that the replied users list was built
-        print("Finished")
+        self.last_refresh = time()  # Store the time that the replied users list was built
 
         # Load blacklist of subreddits
         print("Loading subreddits blacklist... ", end="", flush=True)
-        self.blacklist = set()
-        try:
-            with open("blacklist.txt", "r") as blacklist_file:
-                for line in blacklist_file:
-                    self.blacklist.add(line.strip())    # Strip the text from the line break and spaces at both ends
-            print("Finished")
-        except FileNotFoundError:
-            print("No blacklist found")
+        self.blacklist = Blacklist(self.state, self.reddit)     # (it is reloaded when the file changes)
+        print("Finished")
         
         # Load responses
         print("Loading responses list... ", end="", flush=True)
-        self.temp_file = Path("temp.bin")   # Temporary file for the responses in the queue
+        self.responses = dict()     # Response pool of each responses file
+        for rule in self.rules:
+            if rule.responses not in self.responses:
+                self.responses[rule.responses] = ResponsePool(self.state, rule.responses, name=f"responses:{rule.responses}", seed=seed)
+        self.import_responses_queue()
+        print("Finished")
+
+        # Logs of the replies and of the errors (each shard has its own files)
+        # The records are written on the background, so logging never waits for the disk
+        log_files = replies_logs(shards)                    # (the logs of all shards, for the counter)
+        self.log_file_name = replies_log(shard, shards)
+        self.reply_checkpoint_key = self.worker_key("reply_checkpoint")    # Key on the state of the reply being made
+        self.log = EventLog(self.log_file_name, on_flush=self.log_flushed)
+        self.error_log = EventLog(self.log_file_name.replace("chickenbot_log", "error_log"), max_bytes=1024*1024, backups=5)
         
-        if self.temp_file.exists():
-            # Load the responses from the temporary file, if one exists
-            with open(self.temp_file, "rb") as temp:
-                self.responses = pickle.load(temp)
-        else:
-            # If not, then build the response queue from scratch
-            self.responses = deque()
-            self.refresh_responses()
+        # Whether the counter is in sync with the logs (checked before the recovery below, which may write to the log)
+        self.reply_counter_session = 0  # Replies during the current bot session
+        counter_in_sync = self.state.counter_in_sync({path: log_signature(path) for path in log_files})
         
-        print("Finished")
+        # Finish recording the reply that was being made when the bot last stopped (if any)
+        self.recover_reply()
 
         # Update the counter for the amount replies the bot has made so far
         print("Updating bot replies counter... ", end="", flush=True)
-        self.reply_counter = counter_start
-        self.reply_counter_session = 0  # Replies during the current bot session
-        self.log_file_name = "chickenbot_log.txt"
-        try:
-            with open(self.log_file_name, "r") as log_file:
-                # Count the lines on the log file
-                for line in log_file:
-                    if line.strip():    # Do not count blank lines
-                        self.reply_counter += 1
-        except FileNotFoundError:
-            pass
+        if counter_in_sync:
+            # The counter is read from the state, as long the logs have not changed since it was saved
+            self.reply_counter = self.state.get("reply_counter")
+        else:
+            # Otherwise it is recomputed by counting the replies on the logs (of all shards)
+            signatures = {path: log_signature(path) for path in log_files}
+            self.reply_counter = self.state.rebuild_reply_stats(read_replies(log_files), counter_start, signatures)
         print("Finished")
 
         # Interval to check for private messages
-        self.message_wait = message_wait
+        # (it doubles after each check without new messages, and goes back to the shortest after a reply)
+        self.inbox = inbox
+        self.message_min_wait = message_min_wait
+        self.message_max_wait = message_max_wait
+        self.inbox_backoff = message_min_wait   # Current time in seconds between checks of the inbox
+        self.inbox_wake = Event()               # Set after a reply, so the inbox listener shortens its wait
+        self.async_wakes = dict()               # Wake event of a listener: its event loop and asyncio event (on the asyncio engine)
+        self.my_id = None       # Bot's user ID (fetched when the inbox is first checked)
+        self.username = None    # Bot's username (see 'bot_username()')
+        self.handled_messages = set()   # Fullnames of the messages already handled, but not yet marked as read
+
+        # Supervision of the listeners (see 'watchdog()')
+        self.watchdog_interval = watchdog_interval
+        self.stuck_timeout = stuck_timeout
+        self.heartbeat_file = heartbeat_file
+        self.heartbeats = {     # Name of each listener: times of its latest check and of the check in progress, whether it is stuck, and its restarts
+            name: {"last_check": None, "busy_since": None, "stuck": False, "restarts": 0} for name, check, interval, wake in self.listeners()
+        }
 
         self.running = True     # Indicate to the threads that the bot is running
         separator = "".ljust(get_terminal_size().columns - 1, "-")
         print(f"ChickenBot has started! Bot is now running.\n{separator}")
-        
-    def refresh_responses(self):
-        """Once all responses have been used, this method is called for
-        rebuilding the responses queue"""
+    
+    def describe_metrics(self):
+        """Set the help texts of the bot's metrics."""
 
-        # Read the responses from the file and append them to the queue
-        with open("responses.txt", "r", encoding="utf-8") as responses_file:
-            for line in responses_file:
-                self.responses.append(line.strip())
-            
-            # Randomize the order of the responses
-            shuffle(self.responses)
+        descriptions = {
+            "chickenbot_search_cycle_seconds": "Duration of the search cycles",
+            "chickenbot_posts_scanned_total": "Posts found by the search",
+            "chickenbot_posts_matched_total": "Posts that passed all checks for getting a reply",
+            "chickenbot_posts_filtered_total": "Posts that failed a check for getting a reply, by reason",
+            "chickenbot_reply_seconds": "Time taken to post a reply",
+            "chickenbot_replies_total": "Replies posted",
+            "chickenbot_forbidden_total": "Replies refused by Reddit (HTTP 403)",
+            "chickenbot_errors_total": "Errors when communicating with Reddit, by exception",
+            "chickenbot_inbox_pass_seconds": "Duration of the checks of the private messages",
+            "chickenbot_removal_requests_total": "Comment removal requests processed",
+            "chickenbot_api_requests_total": "HTTP requests made to Reddit",
+            "chickenbot_api_request_seconds": "Duration of the HTTP requests made to Reddit",
+            "chickenbot_api_received_bytes_total": "Bytes received from Reddit",
+            "chickenbot_api_remaining": "Remaining requests on the current rate limit window",
+            "chickenbot_retries_total": "Operations retried after a temporary error, by operation",
+            "chickenbot_listener_restarts_total": "Listeners restarted by the watchdog after their thread or task stopped, by listener",
+            "chickenbot_listener_stuck_total": "Checks of the listeners that ran for longer than the stuck timeout, by listener",
+            "chickenbot_listener_last_check_timestamp": "Time (Unix epoch) of the latest check of each listener",
+            "chickenbot_heartbeat_timestamp": "Time (Unix epoch) of the latest pass of the watchdog",
+        }
+        for name, description in descriptions.items():
+            self.metrics.describe(name, description)
+    
+    def import_responses_queue(self):
+        """Move the responses queue saved by older versions of the bot (on the state,
+        or on the 'temp.bin' file before that) to the pool of the default rule."""
+
+        queue = self.state.get("responses")
+        temp_file = Path("temp.bin")
+        if (queue is None) and temp_file.exists():
+            try:
+                with open(temp_file, "rb") as temp:
+                    queue = list(pickle.load(temp))
+            except (pickle.UnpicklingError, EOFError, ValueError, AttributeError, TypeError) as error:
+                # A corrupt file (e.g. cut by a crash while it was being written) is dropped,
+                # and the responses are used in the pool's own order
+                print(f"Warning: discarded the old responses queue on '{temp_file}' ({error!r})")
         
-        # Create the temporary file for the responses queue
-        self.save_temp()
+        if queue is not None:
+            self.responses[self.rules[0].responses].import_queue(queue)
+            self.state.set(responses=None)
+        temp_file.unlink(missing_ok=True)
+    
+    def worker_key(self, name):
+        """Key on the saved state of a value that each shard keeps on its own."""
+
+        return name if self.shards == 1 else f"{name}:{self.shard}"
+    
+    def log_flushed(self, signature, records):
+        """Store the new signature of the replies log (called by the log's writer thread).
+        The reply checkpoint is cleared once its reply is on the log."""
+
+        logged = [record.get("comment") for record in records if record["kind"] == "reply"]
+        self.state.record_log_signature(self.log_file_name, signature, self.reply_checkpoint_key, logged)
+    
+    def update_limits(self):
+        """Get the rate limit reported by Reddit, and store the remaining requests on the metrics."""
+
+        limits = self.reddit.auth.limits
+        if limits.get("remaining") is not None:
+            self.metrics.set("chickenbot_api_remaining", limits["remaining"])
+        return limits
     
-    def save_temp(self):
-        """Saves a temporary file for the responses queue.
-        This allows the bot, when restarted, to continue from where it stopped."""
+    def load_replied_users(self):
+        """Load from the saved state the users who are still on cooldown."""
+
+        print("Loading the latest replied users... ", end="", flush=True)
+        current_time = time()
+        for user_id, expires_at in self.state.replied_users(self.user_cooldown).items():
+            if expires_at > current_time:
+                self.replied_users.add(user_id, expires_at)
         
-        # Create the temporary file with the responses queue
-        with open(self.temp_file, "wb") as temp:
-            pickle.dump(self.responses, temp)
+        self.previous_reply_time = self.state.get(self.worker_key("previous_reply_time"), self.previous_reply_time)
+        print("Finished")
     
+    def reconcile_replied_users(self, cursor_loaded):
+        """Rebuild the replied users from the bot's comment history on Reddit,
+        and then save them to the state."""
+
+        print("Looking for the latest replied users... ", end="", flush=True)
+        my_comments = self.reddit.user.me().comments.new()      # Most recent comments of the bot
+        
+        replied_posts = dict()  # Fullnames of the recently replied posts and the times of the replies
+        bot_replies = dict()    # Fullnames of the posts and of the bot's comments on them
+        for count, comment in enumerate(my_comments):
+            bot_replies.setdefault(comment.link_id, comment.fullname)
+            current_time = time()                           # Time now
+            comment_time = comment.created_utc              # Time of the bot reply
+            comment_age = current_time - comment_time       # Difference between the two times
+            if count == 0:
+                for query in self.queries:
+                    # Fall back to the latest submission replied by bot when there is no saved cursor
+                    self.cursors.setdefault(query, {"fullname": comment.link_id, "created_utc": comment.created_utc})
+                self.previous_reply_time = comment_time     # Time of the latest bot reply
+
+            if comment_age < self.user_cooldown:
+                # Store the post and comment time if the bot reply was made before the cooldown period
+                replied_posts.setdefault(comment.link_id, comment_time)    # (the comments come from the newest)
+        
+        # Get the authors of the replied posts (the posts are fetched in bulk, since the comments do not have the author's ID)
+        replied = dict()        # User IDs and times of their latest replies
+        posts = self.resolve_fullnames(replied_posts)
+        for post_name, comment_time in replied_posts.items():
+            replied_user = author_id(posts.get(post_name))
+            if replied_user is not None:    # (deleted posts and authors have no ID)
+                replied.setdefault(replied_user, comment_time)
+        
+        for user_id, reply_time in replied.items():
+            self.replied_users.add(user_id, reply_time + self.user_cooldown)
+        
+        # Save the rebuilt state
+        self.state.add_replied_users({user: (reply_time, reply_time + self.user_cooldown) for user, reply_time in replied.items()})
+        self.state.set(**{self.worker_key("previous_reply_time"): self.previous_reply_time})
+        self.state.add_bot_replies(bot_replies)
+        if not cursor_loaded:
+            self.save_cursor()
+        print("Finished")
+        
+    def load_cursor(self):
+        """Loads the search cursors saved by a previous session.
+        Returns whether there was a cursor for every query."""
+
+        saved = self.state.get("search_cursors", dict())
+        self.cursors = {query: cursor for query, cursor in saved.items() if query in self.queries}
+
+        # The cursor saved by older versions belongs to the first query
+        old_cursor = self.state.get("search_cursor")
+        if (old_cursor is not None) and (self.shard == 0) and (self.queries[0] not in self.cursors):
+            self.cursors[self.queries[0]] = old_cursor
+        
+        return all(query in self.cursors for query in self.queries)
+
+    def save_cursor(self):
+        """Saves the search cursors (fullname and creation time of the newest post found by each query).
+        They are merged with the cursors of the other shards' queries."""
+
+        self.state.update("search_cursors", lambda saved: {**(saved or dict()), **self.cursors})
+
+    def new_submissions(self, query):
+        """Generator of the search results of a query that are newer than its cursor.
+
+        The results are sorted from newest to oldest, so the search stops paging as
+        soon as it reaches the post of the cursor. In case that post has been deleted
+        meanwhile, the search also stops on the first post older than the cursor's
+        creation time. On the first run (no cursor), only the first page is fetched."""
+
+        cursor = self.cursors.get(query, {"fullname": "", "created_utc": 0.0})
+        lookup = self.subreddit.search(
+            self.blacklist.exclude_from(query),                 # Search query for the questions, without the blacklisted subreddits
+            sort="new",                                         # Sorted by newest posts
+            limit=None if cursor["fullname"] else 100,          # Keep paging until the cursor is reached
+        )
+
+        for submission in lookup:
+            if submission.name == cursor["fullname"]:
+                break
+            if submission.created_utc < cursor["created_utc"]:
+                break
+            yield submission
+
     def submission_testing(self, submission):
         """Checks whether a submission passes the checks for getting a reply.
         
         All checks must pass: post made after bot's previous reply, question in
         the title, subreddit not on blacklist, author didn't get a ChickenBot's
-        reply within the last day (default)."""
+        reply within the last day (default).
+        
+        The checks only use the data that came with the post on the listing,
+        so they do not make any request to Reddit.
+        
+        Returns the rule of the question that was found, or False if some check failed."""
 
         # Was the submission made after the last bot reply?
-        post_time = datetime.fromtimestamp(submission.created_utc)
+        post_time = submission.created_utc
         if post_time < self.previous_reply_time:
-            return False
+            return self.filtered("old_post")
 
         # Is the question on the title?
-        title = submission.title.lower()
-        if self.question not in title:
-            return False
+        rule = self.matcher.match(submission.title)
+        if rule is None:
+            return self.filtered("no_question")
         
         # Is the post made on a non-blacklisted subreddit?
-        subreddit_id = submission.subreddit.name
-        if subreddit_id in self.blacklist:
-            return False
+        if self.blacklist.blocks(submission.subreddit_id, submission.subreddit.display_name):
+            return self.filtered("blacklisted")
         
         # The author must not have gotten a reply from this bot recently (default: less than 24 hours ago)
         self.refresh_authors()          # Update the recently replied users list (default: less than 1 day)
-        user_id = submission.author.id  # Get the ID of the current replied user
+        user_id = author_id(submission)     # Get the ID of the current replied user
         
-        if user_id in self.replied_users:   # If the user is on the recent list
-            reply_time = self.replied_users[user_id]    # Last time when the user gor a reply from this bot
-            reply_age = datetime.utcnow() - reply_time     # How long has passed since then
-            
-            if reply_age < self.user_cooldown:          # Whether the comment age is smaller than the cooldown period
-                return False
+        if user_id is None:                 # If the author has deleted the post or their account
+            return self.filtered("deleted_author")
+        if user_id in self.replied_users:   # If the user is still on cooldown
+            return self.filtered("cooldown")
         
-        # Return True when all checks passed
-        return True
+        # Return the matched rule when all checks passed
+        self.metrics.count("chickenbot_posts_matched_total", rule=rule.name)
+        return rule
+    
+    def filtered(self, reason):
+        """Count a post that failed a check, and return False."""
+
+        self.metrics.count("chickenbot_posts_filtered_total", reason=reason)
+        return False
 
     def refresh_authors(self):
-        """Remove from the replied authors dictionary those authors who got the last
-        reply for longer than the cooldown period (default 1 day).
+        """Remove from the replied authors those authors whose cooldown period
+        has expired (default: 1 day after their last reply).
         
-        The check is run each 30 minutes (by default)."""
+        The check is run each 30 minutes (by default). The expired authors come
+        out of the cooldown index in order, so the other authors are not checked."""
 
         # Check if the minimum refresh period has passed
-        last_refresh_age = datetime.utcnow() - self.last_refresh
-        
-        # Exit the function if the minimum refresh time has not passed (default: 30 minutes)
-        if last_refresh_age < self.user_refresh:
+        current_time = time()
+        if current_time - self.last_refresh < self.user_refresh:
             return
-        
-        # Loop through the replied users dictionary
-        authors_to_remove = set()
-        for user_id, time in self.replied_users.items():
-            
-            # How long ago the user got a reply from this bot
-            reply_age = datetime.utcnow() - time
-            
-            # Whether that reply for longer than the cooldown period (default: 1 day)
-            if reply_age >= self.user_cooldown:
-                authors_to_remove.add(user_id)  # Queue to remove the user from the dictionary if the cooldown period has passed
-                """NOTE
-                Deleting a dictionary item during the its own iteration throws a RuntimeError.
-                So instead I am storing their ids to remove from the dict after the loop.
-                """
+        self.last_refresh = current_time
         
         # Remove the authors whose cooldown period expired
+        authors_to_remove = self.replied_users.expire(current_time)
         if authors_to_remove:
-            for user_id in authors_to_remove:
-                del self.replied_users[user_id]
-    
-    def make_reply(self, submission):
-        """The bot gets a response from the queue and post a reply to the post.
+            self.state.remove_replied_users(authors_to_remove)
         
-        Once all responses have been used, the queue is rebuilt. This way the
-        bot only repeats the same response after all others have been used
-        at least once."""
+        # Forget the claims made before the longest cooldown
+        cooldowns = [rule.cooldown for rule in self.rules if rule.cooldown is not None]
+        self.state.prune_claims(max(cooldowns + [self.user_cooldown]))
+    
+    def claim(self, submission, rule):
+        """Take a post for replying, on the state shared with the other shards.
+        Returns whether the post can get a reply from this process."""
 
-        # Whether the response queue is empty
-        if not self.responses:
-            # Reload the responses list when all responses have been used
-            self.refresh_responses()
+        cooldown = rule.cooldown if rule.cooldown is not None else self.user_cooldown
+        if self.state.claim(submission.fullname, author_id(submission), self.worker, cooldown):
+            return True
+        self.filtered("claimed")
+        return False
+    
+    def add_cooldown(self, user_id, cooldown=None):
+        """Put an author on cooldown, starting now.
+        The cooldown is in seconds (by default, the bot's 'user_cooldown')."""
 
-        # Get and remove a response from the queue
-        response = self.responses.pop().replace("&NewLine;", "\n\n")
-        self.save_temp()
+        reply_time = time()
+        expires_at = reply_time + (cooldown if cooldown is not None else self.user_cooldown)
+        self.replied_users.add(user_id, expires_at)
+        self.state.add_replied_users({user_id: (reply_time, expires_at)})
+    
+    def make_reply(self, submission, rule=None):
+        """The bot gets a response from the rule's pool and post a reply to the post.
+        (by default, the rule is the one of the question on the post's title)
         
-        # Build the reply text
-        header = ">Why did the chicken cross the road?\n\n"
-        footer = f"\n\n---\n\n^(This is an automatic comment made by a bot, who has answered so far to {self.reply_counter+1} doubts concerning gallinaceous roadgoing birds.)"
-        reply_text = f"{header}{response}{footer}"
+        The responses come in a random order, and the bot only repeats the same
+        response after all others have been used at least once."""
+
+        # Prepare the reply
+        # (the post is already claimed, so its author is released if the reply cannot be made)
+        if rule is None:
+            rule = self.matcher.match(submission.title) or self.rules[0]
+        username = submission.author.name if submission.author is not None else "[deleted]"   # Post author's username
+        subreddit = submission.subreddit.display_name
+        try:
+            reply_text = self.reply_text(submission, rule)
+        except Exception as error:      # (e.g. no responses on the file, or a footer that cannot be formatted)
+            self.state.release_author(submission.fullname)
+            self.log.write("failed", user=username, subreddit=subreddit, post=submission.permalink, error=str(error))
+            self.log_error(error)
+            return
+        
+        # Save a checkpoint of the reply before posting it
+        # (it stays on the state until the reply is on the log, see 'recover_reply()')
+        checkpoint = {
+            "post_name": submission.fullname, "post": submission.permalink, "user": username, "user_id": author_id(submission),
+            "subreddit": subreddit, "rule": rule.name, "cooldown": rule.cooldown,
+        }
+        self.state.set(**{self.reply_checkpoint_key: checkpoint})
         
         # Posting the reply
+        # (it is not retried on errors, since Reddit may have posted it anyway)
         try:
             #print(f"{submission.title}\n{reply_text}\n----------\n")
-            my_comment = submission.reply(reply_text)   # Submit the reply
-            self.reply_counter += 1                     # Increase the reply counter
-            self.reply_counter_session += 1
-            self.has_replied = True     # Flag that the bot has replied on the current cycle
-
-            # Add user to the replied users dictionary
-            self.replied_users[submission.author.id] = datetime.utcnow()
-
-            # Log to file the bot comment
-            with open(self.log_file_name, "a", encoding="utf-8") as log_file:
-                current_time = str(datetime.utcnow())[:19]              # Current date and time as string (The [:19] slice strips the fractional part of the seconds)
-                username = submission.author.name                       # Get the post author's username
-                link = my_comment.permalink                             # Reddit link to the bot comment
-                log_text = f"{current_time}\tu/{username}\t{link}\n"    # Text to be written on the log file
-                log_file.write(log_text)                                # Write the log file
-                print("OK:", log_text, end="")                          # Print the logged text to the terminal
-            
-            # Generate link so the original poster can delete the comment
-            # (the 'urllib.parse.quote()' function escapes special characters and spaces)
-            message_subject = quote("Removal of ChickenBot's comment", safe="")
-            message_body = quote(f"Please remove {link}\n\n[do not edit the first line]", safe="")
-            removal_link = f"/message/compose/?to=u%2FChickenRoad_Bot&subject={message_subject}&message={message_body}"
-            
-            # Edit the comment to append the removal link
-            edited_comment = my_comment.body + f"^( If you are the thread's author, you can )[^(click here)]({removal_link})^( to delete this comment.)"
-            sleep(5)
-            my_comment.edit(edited_comment)
+            with self.metrics.timer("chickenbot_reply_seconds"):
+                my_comment = submission.reply(reply_text)   # Submit the reply
         
         except Forbidden as error:   # If the bot didn't have permission to reply to the post
+            self.metrics.count("chickenbot_forbidden_total")
+            self.state.release_author(submission.fullname)  # The author can still get a reply on another post
+            self.state.set(**{self.reply_checkpoint_key: None})
             
-            # Log the forbiden post to file
-            with open("forbiden_log.txt", "a", encoding="utf-8") as log_file:
-                current_time = str(datetime.utcnow())[:19]              # Current date and time
-                username = submission.author.name                       # Get the post author's username
-                link = submission.permalink                             # Reddit link to the submission
-                log_text = f"{current_time}\tu/{username}\t{link}\t{error}\n"    # Text to be written on the log file
-                log_file.write(log_text)                                # Write the log file
-                print("FORBIDEN:", log_text, end="")                    # Print the logged text to the terminal
-        
-        except PrawcoreException as error:   # If some other problem happened
-            current_time = str(datetime.utcnow())[:19]
-            log_text = f"{current_time}\tu/{username}\t{link}\t{error}\n"
-            print("Failed:", log_text, end="")
-
-            with open("forbiden_log.txt", "a", encoding="utf-8") as log_file:
-                log_file.write(log_text)
-
-            my_exception = format_exc()
-            my_date = current_time + "\n\n"
-            with open("error_log.txt", "a", encoding="utf-8") as error_log:
-                error_log.write(my_date)
-                error_log.write(my_exception)
-                error_log.write("\n\n---------------\n")
+            # Log the forbiden post
+            self.log.write("forbidden", user=username, subreddit=subreddit, post=submission.permalink, error=str(error))
+            print("FORBIDEN:", utc_now(), f"u/{username}", submission.permalink, error)
 
-    def check_submissions(self):
-        """Look for submissions for replying to."""
+            # Stop replying on the subreddit if it keeps refusing the replies
+            if self.blacklist.refused(submission.subreddit_id, subreddit):
+                self.log.write("blacklisted", subreddit=subreddit, until=self.blacklist.learned[submission.subreddit_id]["until"])
+                print("BLACKLISTED:", utc_now(), f"r/{subreddit}")
+            return
+        
+        except (PrawcoreException, RedditAPIException) as error:   # If some other problem happened (e.g. a locked thread)
+            self.state.release_author(submission.fullname)
+            self.state.set(**{self.reply_checkpoint_key: None})
+            self.log.write("failed", user=username, subreddit=subreddit, post=submission.permalink, error=str(error))
+            self.log_error(error)
+            return
+        
+        self.metrics.count("chickenbot_replies_total")
+        self.reply_counter_session += 1             # Increase the session's reply counter
+        self.has_replied = True     # Flag that the bot has replied on the current cycle
 
-        while self.running:
-            # Track whether the bot has replied this cycle
-            self.has_replied = False
-
-            # Search for posts with the question made after the previous search
-            lookup = self.subreddit.search(
-                self.query,                             # Search query for the question
-                sort="new",                             # Sorted by newest posts
-                # params={"before":self.previous_post},   # Made after the newest post found
+        # Record the reply (cooldown, bot's comment, counter, statistics and log)
+        checkpoint.update(comment_name=my_comment.fullname, comment=my_comment.permalink)
+        self.finish_reply(checkpoint)
+        self.blacklist.accepted(submission.subreddit_id)
+
+        # Check the inbox sooner, since the removal requests usually come shortly after the replies
+        self.inbox_backoff = self.message_min_wait
+        self.wake(self.inbox_wake)
+        print("OK:", utc_now(), f"u/{username}", my_comment.permalink)   # Print the logged reply to the terminal
+    
+    def reply_text(self, submission, rule):
+        """Build the text of a reply to a post: the rule's header, the next response from
+        the rule's pool, the footer with the reply counter, and the link for removing it."""
+
+        response = self.responses[rule.responses].next().replace("&NewLine;", "\n\n")
+        
+        # Generate link so the original poster can delete the comment
+        # (the removal request refers to the post, so the link is ready before the comment exists)
+        # (the 'urllib.parse.quote()' function escapes special characters and spaces)
+        post_link = f"/r/{submission.subreddit.display_name}/comments/{submission.id}/"
+        message_subject = quote("Removal of ChickenBot's comment", safe="")
+        message_body = quote(f"Please remove the reply to {post_link}\n\n[do not edit the first line]", safe="")
+        bot_name = quote(f"u/{self.bot_username()}", safe="")
+        removal_link = f"/message/compose/?to={bot_name}&subject={message_subject}&message={message_body}"
+        
+        # Build the reply text
+        header = f"{rule.header}\n\n"
+        counter = self.state.get("reply_counter", self.reply_counter)    # (the other shards may have replied meanwhile)
+        footer = "\n\n---\n\n" + rule.footer.format(counter=counter+1)
+        removal = f"^( If you are the thread's author, you can )[^(click here)]({removal_link})^( to delete this comment.)"
+        return f"{header}{response}{footer}{removal}"
+    
+    def bot_username(self):
+        """The bot's username, from the account's settings. When the settings do not have it
+        (e.g. when the bot logs in with a refresh token), it is fetched from Reddit once."""
+
+        if self.username is None:
+            self.username = self.reddit.config.username or self.reddit.user.me().name
+        return self.username
+    
+    def finish_reply(self, checkpoint):
+        """Record a posted reply, from its checkpoint (see 'make_reply()').
+
+        The author's cooldown, the bot's comment, the counter and the statistics are
+        saved on a single transaction, which also adds the reply's counter to the
+        checkpoint. So a checkpoint that already has a counter is not counted again.
+        Then the reply is logged, and the checkpoint is cleared once the log record
+        is written (see 'log_flushed()')."""
+
+        cooldown = checkpoint["cooldown"] if checkpoint["cooldown"] is not None else self.user_cooldown
+        if "counter" not in checkpoint:
+            reply_time = time()
+            checkpoint["counter"] = self.state.complete_reply(
+                self.reply_checkpoint_key, checkpoint, utc_now()[:10], reply_time, reply_time + cooldown
             )
+            if checkpoint["user_id"] is not None:
+                self.replied_users.add(checkpoint["user_id"], reply_time + cooldown)
+        
+        self.reply_counter = checkpoint["counter"]
+        self.log.write(
+            "reply", user=checkpoint["user"], subreddit=checkpoint["subreddit"], post=checkpoint["post"],
+            comment=checkpoint["comment"], rule=checkpoint["rule"], counter=checkpoint["counter"],
+        )
+    
+    def recover_reply(self):
+        """Finish recording the reply that was being made when the bot last stopped, if any.
 
-            # Loop through the found posts
+        If the bot stopped before knowing whether the reply was posted, the bot's comment
+        is looked up on the post. When it is found, the reply is recorded as usual (it is
+        never posted again), otherwise the checkpoint is dropped."""
+
+        checkpoint = self.state.get(self.reply_checkpoint_key)
+        if checkpoint is None:
+            return
+        print("Recovering the interrupted reply... ", end="", flush=True)
+        
+        if "comment" not in checkpoint:
             try:
-                for count, submission in enumerate(lookup):
-                    
-                    # Store the ID of the newest post
-                    if count == 0:
-                        self.previous_post = submission.name
-
-                    # Check whether the post fits the criteria for getting a reply
-                    if not self.submission_testing(submission):
-                        continue
-
-                    # Make a reply
-                    self.make_reply(submission)
-                    sleep(5)
+                replies = self.retry.call(lambda: self.find_bot_replies([checkpoint["post_name"]]), "recovery")
+                comment_name = replies.get(checkpoint["post_name"])
+            except (PrawcoreException, RedditAPIException) as error:
+                print("Skipped")    # (the checkpoint is kept until the next reply, so a restart can try again)
+                self.log_error(error)
+                return
+            if comment_name is None:
+                self.state.release_author(checkpoint["post_name"])
+                self.state.set(**{self.reply_checkpoint_key: None})
+                print("The reply was not posted")
+                return
+            checkpoint.update(comment_name=comment_name, comment=f"{checkpoint['post']}{comment_name[3:]}/")
+        
+        # A reply already counted may also be on the log already (if only the clearing of its checkpoint failed)
+        elif "counter" in checkpoint:
+            logged = (record.get("comment") for record in read_records(self.log_file_name, kind="reply"))
+            if checkpoint["comment"] in logged:
+                self.state.set(**{self.reply_checkpoint_key: None})
+                print("Finished")
+                return
+        
+        self.finish_reply(checkpoint)
+        self.log.flush()
+        print("Finished")
+
+    def check_submissions(self):
+        """Look for submissions for replying to (one search cycle)."""
+
+        with self.metrics.timer("chickenbot_search_cycle_seconds"):
+            self.search_cycle()
+    
+    def search_cycle(self):
+        """Search for new posts, and reply to those that pass the checks."""
+
+        # Track whether the bot has replied this cycle
+        self.has_replied = False
+        self.blacklist.refresh()
+
+        # Search for posts with the questions made after the previous search
+        # (a search that fails because of a temporary problem is tried again after a short wait)
+        for query in self.queries:
+            try:
+                self.retry.call(lambda: self.search_query(query), "search")
             
             # Connection to the Reddit server failed
+            # (the old cursor is kept, so the posts missed by this cycle are searched again)
             except (PrawcoreException, RedditAPIException) as error:
-                current_time = str(datetime.utcnow())[:19]
-                print("Warning:", current_time, error)
-                my_exception = format_exc()
-                my_date = str(datetime.now())[:19] + "\n\n"
-
-                with open("error_log.txt", "a", encoding="utf-8") as error_log:
-                    error_log.write(my_date)
-                    error_log.write(my_exception)
-                    error_log.write("\n\n---------------\n")
-
-            # Update the last reply time if the bot has replied this cycle
-            if self.has_replied:
-                self.previous_reply_time = datetime.utcnow()
+                self.log_error(error)
+
+        # Update the last reply time if the bot has replied this cycle
+        if self.has_replied:
+            self.previous_reply_time = time()
+            self.state.set(**{self.worker_key("previous_reply_time"): self.previous_reply_time})
+    
+    def search_query(self, query):
+        """Search for the new posts of a query, and reply to those that pass the checks.
+        The query's cursor only moves forward when the whole search succeeds."""
+
+        lookup = self.new_submissions(query)
+        newest_post = None
+        arrival_times = []  # Creation times of the posts found that ask one of the questions
+
+        # Loop through the found posts
+        # (when the search is retried, the posts already processed are skipped by 'first_seen()')
+        for count, submission in enumerate(lookup):
             
-            # Wait for one hour (default) before searching again for posts
-            sleep(self.wait)
+            # Store the newest post, to be used as the cursor of the next search
+            if count == 0:
+                newest_post = submission
+            
+            # The scheduler only learns from the posts with the question
+            # (the search also finds titles that merely have the same words)
+            if self.matcher.match(submission.title) is not None:
+                arrival_times.append(submission.created_utc)
+            if not self.first_seen(submission):
+                continue
+            self.metrics.count("chickenbot_posts_scanned_total", source="search")
+
+            # Check whether the post fits the criteria for getting a reply
+            rule = self.submission_testing(submission)
+            if not rule:
+                continue
+
+            # Make a reply (unless another shard has taken the post or its author)
+            if self.claim(submission, rule):
+                with self.reply_lock:
+                    self.make_reply(submission, rule)
+                sleep(5)
+
+        # Move the search cursor forward to the newest post found
+        # and let the scheduler learn from the questions that were found
+        if newest_post is not None:
+            self.cursors[query] = {"fullname": newest_post.name, "created_utc": newest_post.created_utc}
+            self.save_cursor()
+            self.scheduler.record_hits(arrival_times)
+            self.state.set(**{self.worker_key("arrival_times"): list(self.scheduler.arrivals)})
+    
+    def first_seen(self, submission, max_size=10000):
+        """Whether the post is being processed for the first time (by the search or the stream).
+        The latest 'max_size' posts are remembered."""
+
+        with self.processed_lock:
+            if submission.name in self.processed:
+                return False
+            self.processed[submission.name] = None
+            if len(self.processed) > max_size:
+                self.processed.popitem(last=False)
+            return True
+    
+    def check_stream(self):
+        """Process the new posts from one request to the streamed subreddits."""
+
+        if self.stream is None:
+            # 'pause_after=-1' makes the stream return None after each request (even when it had new posts),
+            # so a check always ends and the waiting between the requests is controlled by 'stream_interval()'
+            subreddits = self.reddit.subreddit(self.stream_subreddits)
+            self.stream = subreddits.stream.submissions(pause_after=-1, skip_existing=True)
+        
+        found = False
+        self.blacklist.refresh()
+        try:
+            for submission in self.stream:
+                if submission is None:
+                    break
+                found = True
+                if not self.first_seen(submission):
+                    continue
+                self.metrics.count("chickenbot_posts_scanned_total", source="stream")
+
+                # Check whether the post fits the criteria for getting a reply
+                rule = self.submission_testing(submission)
+                if rule and self.claim(submission, rule):
+                    with self.reply_lock:
+                        self.make_reply(submission, rule)
+        
+        except (PrawcoreException, RedditAPIException) as error:
+            self.stream = None  # Start a new stream on the next check
+            self.log_error(error)
+        
+        # Check again sooner when posts are coming, and back off when they are not
+        if found:
+            self.stream_backoff = 1
+        else:
+            self.stream_backoff = min(self.stream_backoff * 2, self.stream_wait)
+    
+    def stream_interval(self):
+        """Time in seconds to wait before checking the stream again."""
+
+        return self.scheduler.respect_limits(self.stream_backoff, self.update_limits())
+    
+    def search_interval(self):
+        """Time in seconds to wait before searching again for posts.
+        It depends on how often the question has been found, and on the remaining API requests."""
+
+        return self.scheduler.next_interval(self.update_limits())
     
     def private_messages(self):
-        """Listens to the bot account's private chat, in order to process removal requests."""
+        """Checks the bot account's private chat once, in order to process removal requests."""
+
+        with self.metrics.timer("chickenbot_inbox_pass_seconds"):
+            try:
+                self.retry.call(self.inbox_pass, "inbox")
+            
+            # Logs the error if something wrong happens while handling messages
+            # (probably Reddit was down or the user blocked the bot)
+            except (PrawcoreException, RedditAPIException) as error:
+                self.log_error(error)
+    
+    def inbox_pass(self):
+        """Process the new removal requests on the inbox.
+
+        The private messages come from the newest, so the listing stops on the first
+        message that was already read (usually a single request). The messages are
+        marked as read in bulk (up to 25 messages per request), only after their
+        requests were processed. So if the pass fails, the messages not yet handled
+        stay unread for the next pass, and those already handled are not processed
+        again (see 'handled_messages')."""
 
-        # Regular expression to extract the comment ID from the message body
+        # Regular expressions to extract from the message body the ID of the post
+        # (or the ID of the comment, on requests made by older versions of the bot)
+        removal_regex = re.compile(r"remove the reply to /r/\w+/comments/(\w+)")
         message_regex = re.compile(r"remove /r/.+?/comments/.+?/.+?/(\w+)")
 
         # Bot's user ID
-        my_id = self.reddit.user.me().fullname
+        if self.my_id is None:
+            self.my_id = self.reddit.user.me().id
+        my_id = self.my_id
         
         # Check for new private messages
-        while self.running:
-            try:
-                private_inbox = self.reddit.inbox.messages()
-                for message in private_inbox:
-
-                    # Skip the message if it has already been read
-                    if not message.new: continue
-
-                    # Mark the message as "read"
-                    message.mark_read()
-                    
-                    # Get the author and the requested comment
-                    message_author_id = message.author_fullname
-                    message_author = self.reddit.redditor(fullname=message_author_id)
-                    if message_author is None: continue
-                    
-                    # Get the comment ID from the message
-                    search = message_regex.search(message.body)
-                    if search is None: continue
-                    comment_id = search.group(1)
-                    
-                    try:
-                        # Get the paramentes of the comment's thread
-                        comment = self.reddit.comment(comment_id)
-                        post_id = comment.link_id.split("_")[1]
-                        post = self.reddit.submission(post_id)
-                        post_title = post.title
-                        post_url = post.permalink
-                        post_author_id = post.author_fullname
-                    
-                    except (ClientException, AttributeError):
-                        # If the comment was not found
-                        if "remov" in message.subject:
-                            message_author.message(
-                                subject = "ChickenBot comment removal",
-                                message = f"Sorry, the requested comment '{comment_id}' could not be found. Possibly it was already deleted."
-                            )
-                        continue
-                    
-                    # Permanent link to the comment
-                    comment_url = comment.permalink
-
-                    # Verify the author and respond
-                    
-                    if post_author_id == message_author_id:
-                        # Delete comment if it was requested by the own author
-
-                        # Check if the bot is the comment's author
-                        if comment.author_fullname == my_id:
-                            comment.delete()
-                            message_author.message(
-                                subject = "ChickenBot comment removed",
-                                message = f"The bot has deleted [its comment]({comment_url}) from your post [{post_title}]({post_url}).\n\nSorry for any inconvenience that the bot might have caused."
-                            )
-                            
-                            # The bot won't post to this author's threads for the duration of their cooldown time
-                            self.replied_users[post.author.id] = datetime.utcnow()
-                        
-                        else:
-                            message_author.message(
-                                subject = "ChickenBot comment removal",
-                                message = "Sorry, the bot can only delete comments made by itself."
-                            )
-
-                    else:
-                        # Refuse to delete if it was someone else who requested
-                        message_author.message(
-                            subject = "ChickenBot comment",
-                            message = f"Sorry, only the original poster u/{post.author.name} can request the removal of [my comment]({comment_url}) on the thread [{post_title}]({post_url})."
-                        )
+        # (the errors are handled by 'private_messages()', which retries the whole pass)
+
+        # Gather the unread messages
+        unread_messages = []
+        for message in self.reddit.inbox.messages(limit=None):
+            if not message.new:
+                break
+            unread_messages.append(message)
+        
+        # Check sooner while messages are coming, and back off when they are not
+        if unread_messages:
+            self.inbox_backoff = self.message_min_wait
+        else:
+            self.inbox_backoff = min(self.inbox_backoff * 2, self.message_max_wait)
+        
+        # Gather the new removal requests from the inbox
+        # (each one as: message, fullname of the post, fullname of the comment, description of what was requested)
+        removal_requests = []
+        for message in unread_messages:
+            if message.fullname in self.handled_messages: continue
             
-            # Logs the error if something wrong happens while handling messages
-            # (probably Reddit was down or the user blocked the bot)
+            # Skip the message if its author is gone
+            if message.author is None:
+                self.handled_messages.add(message.fullname)
+                continue
+            
+            # Get the post ID or comment ID from the message
+            search = removal_regex.search(message.body)
+            if search is not None:
+                post_id = search.group(1)
+                removal_requests.append([message, f"t3_{post_id}", None, f"reply to the post '{post_id}'"])
+                continue
+            search = message_regex.search(message.body)
+            if search is not None:
+                comment_id = search.group(1)
+                removal_requests.append([message, None, f"t1_{comment_id}", f"comment '{comment_id}'"])
+                continue
+            self.handled_messages.add(message.fullname)     # (not a removal request)
+        
+        # Find the bot's comments on the requested posts
+        requested_posts = [request[1] for request in removal_requests if request[2] is None]
+        bot_replies = self.find_bot_replies(requested_posts)
+        for request in removal_requests:
+            if request[2] is None:
+                request[2] = bot_replies.get(request[1])
+        
+        # Resolve in bulk the requested comments and their threads
+        things = self.resolve_fullnames(
+            [request[1] for request in removal_requests if request[1] is not None]
+            + [request[2] for request in removal_requests if request[2] is not None]
+        )
+        things.update(self.resolve_fullnames(   # The threads of the comments requested by older versions
+            thing.link_id for thing in list(things.values())
+            if thing.fullname.startswith("t1_") and thing.link_id not in things
+        ))
+
+        # Process each request
+        # (a failed request does not stop the others, and it is not tried again, so the user does not get two replies)
+        for message, post_name, comment_name, requested in removal_requests:
+            comment = things.get(comment_name)
+            post = things.get(comment.link_id) if comment is not None else None
+            self.handled_messages.add(message.fullname)
+            try:
+                self.metrics.count("chickenbot_removal_requests_total")
+                self.removal_request(message, requested, comment, post, my_id)
             except (PrawcoreException, RedditAPIException) as error:
-                current_time = str(datetime.utcnow())[:19]
-                print("Warning:", current_time, error)
-                my_exception = format_exc()
-                my_date = str(datetime.now())[:19] + "\n\n"
-
-                with open("error_log.txt", "a", encoding="utf-8") as error_log:
-                    error_log.write(my_date)
-                    error_log.write(my_exception)
-                    error_log.write("\n\n---------------\n")
+                self.log_error(error)
+        
+        # Mark the handled messages as "read"
+        handled = [message for message in unread_messages if message.fullname in self.handled_messages]
+        if handled:
+            self.reddit.inbox.mark_read(handled)
+            self.handled_messages.difference_update(message.fullname for message in handled)
+    
+    def inbox_interval(self):
+        """Time in seconds to wait before checking again for new private messages.
+        It is extended if there are too few API requests remaining."""
+
+        return self.scheduler.respect_limits(self.inbox_backoff, self.update_limits())
+    
+    def log_error(self, error):
+        """Print a warning and write the traceback of the current exception to the error log."""
+
+        self.metrics.count("chickenbot_errors_total", type=type(error).__name__)
+        print("Warning:", utc_now(), error)
+        self.error_log.write("error", type=type(error).__name__, error=str(error), traceback=format_exc())
+    
+    def resolve_fullnames(self, fullnames):
+        """Fetch in bulk the Reddit objects (comments, submissions, subreddits) of a list of fullnames.
+        Each request to Reddit gets up to 100 objects.
+
+        Returns a dictionary of fullnames and their objects. The objects that
+        could not be found are not present on the dictionary."""
+
+        fullnames = list(dict.fromkeys(fullnames))  # Remove the duplicates
+        if not fullnames:
+            return dict()
+        return {item.fullname: item for item in self.reddit.info(fullnames=fullnames)}
+    
+    def find_bot_replies(self, submissions):
+        """Get the fullnames of the bot's comments on a list of posts (fullnames).
+
+        They are looked up on the saved state, and then on the bot's latest
+        comments for those that were not saved. Returns a dictionary of the post
+        fullnames and the comment fullnames that were found."""
+
+        replies = self.state.bot_replies(submissions)
+        missing = set(submissions) - set(replies)
+        if missing:
+            for comment in self.reddit.user.me().comments.new(limit=100):
+                if comment.link_id in missing:
+                    replies.setdefault(comment.link_id, comment.fullname)
+            self.state.add_bot_replies({post: replies[post] for post in missing if post in replies})
+        return replies
+    
+    def removal_request(self, message, requested, comment, post, my_id):
+        """Process a request for removing a bot's comment.
+        The comment and its post should have been already fetched from Reddit,
+        or be None if they could not be found."""
+
+        # Get the author of the message
+        message_author = message.author
+        message_author_id = author_id(message)
+
+        # If the comment was not found
+        if (comment is None) or (post is None):
+            if "remov" in message.subject:
+                message_author.message(
+                    subject = "ChickenBot comment removal",
+                    message = f"Sorry, the requested {requested} could not be found. Possibly it was already deleted."
+                )
+            return
+        
+        # Get the paramentes of the comment's thread
+        post_title = post.title
+        post_url = post.permalink
+        post_author_id = author_id(post)    # Deleted posts have no author
+        
+        # Permanent link to the comment
+        comment_url = comment.permalink
+
+        # Verify the author and respond
+        
+        if (post_author_id is not None) and (post_author_id == message_author_id):
+            # Delete comment if it was requested by the own author
+
+            # Check if the bot is the comment's author
+            if author_id(comment) == my_id:
+                comment.delete()
+                message_author.message(
+                    subject = "ChickenBot comment removed",
+                    message = f"The bot has deleted [its comment]({comment_url}) from your post [{post_title}]({post_url}).\n\nSorry for any inconvenience that the bot might have caused."
+                )
+                
+                # The bot won't post to this author's threads for the duration of their cooldown time
+                self.add_cooldown(post_author_id)
             
-            # Wait for some time before checking for new private messages
-            sleep(self.message_wait)
+            else:
+                message_author.message(
+                    subject = "ChickenBot comment removal",
+                    message = "Sorry, the bot can only delete comments made by itself."
+                )
+
+        else:
+            # Refuse to delete if it was someone else who requested
+            author_name = post.author.name if post.author is not None else "[deleted]"
+            message_author.message(
+                subject = "ChickenBot comment",
+                message = f"Sorry, only the original poster u/{author_name} can request the removal of [my comment]({comment_url}) on the thread [{post_title}]({post_url})."
+            )
     
-    def main(self):
-        """Main loop of the program"""
+    def listeners(self):
+        """List of the bot's listeners. Each listener is a tuple of:
+        name, function that makes one check, function that returns the wait time until the next check,
+        and an event that shortens the wait when it is set (or None)."""
+
+        listeners = []
+        if self.queries:
+            listeners.append(("submissions", self.check_submissions, self.search_interval, None))
+        if self.inbox:
+            listeners.append(("messages", self.private_messages, self.inbox_interval, self.inbox_wake))
+        if self.stream_subreddits:
+            listeners.append(("stream", self.check_stream, self.stream_interval, None))
+        return listeners
+    
+    def listen(self, name, check, interval, wake=None):
+        """Keep running a listener until the bot stops."""
+
+        while self.running:
+            self.run_check(name, check)
+            self.write_metrics()
+            self.pause(interval, wake)
+    
+    def run_check(self, name, check):
+        """Run one check of a listener, and record it on the listener's heartbeat.
+        An unexpected error is logged, instead of stopping the listener."""
+
+        heartbeat = self.heartbeats[name]
+        heartbeat["busy_since"] = time()
+        try:
+            check()
+        except Exception as error:
+            self.log_error(error)
+        finally:
+            heartbeat["busy_since"] = None
+            heartbeat["stuck"] = False
+            heartbeat["last_check"] = time()
+            self.metrics.set("chickenbot_listener_last_check_timestamp", heartbeat["last_check"], listener=name)
+    
+    def pause(self, interval, wake=None):
+        """Wait before the next check of a listener.
+        If the 'wake' event is set meanwhile, the wait starts over with the new interval."""
+
+        if wake is None:
+            sleep(interval())
+            return
+        wake.clear()
+        while wake.wait(interval()):
+            wake.clear()
+    
+    def wake(self, event):
+        """Set the wake event of a listener (see 'pause()'), from any thread.
+        On the asyncio engine, the listener's asyncio event is also set, on its event loop."""
+
+        event.set()
+        waiter = self.async_wakes.get(event)
+        if waiter is not None:
+            loop, async_event = waiter
+            loop.call_soon_threadsafe(async_event.set)
+    
+    def simulate(self, until):
+        """Run the listeners on a single thread, with the clock moved forward to each
+        listener's next check instead of waiting for it, until the clock reaches 'until'.
+        It is meant for a virtual clock (see 'chickenreplay'), so the waits take no time."""
+
+        clock = chickenclock.clock
+        pending = [(time(), number, name, check, interval) for number, (name, check, interval, wake) in enumerate(self.listeners())]
+        heapify(pending)
+        while pending and (pending[0][0] <= until):
+            moment, number, name, check, interval = heappop(pending)
+            clock.advance_to(moment)
+            self.run_check(name, check)
+            heappush(pending, (time() + interval(), number, name, check, interval))
+    
+    def write_metrics(self):
+        """Rewrite the metrics file, if it is enabled.
+        An error writing the file is logged, instead of stopping the listener that wrote it."""
+
+        if self.metrics_file is None:
+            return
+        try:
+            self.metrics.write(self.metrics_file)
+        except OSError as error:
+            self.log_error(error)
+    
+    def supervise(self, name, alive):
+        """Check a listener for the watchdog. Returns whether its thread or task has stopped and must be restarted.
+
+        A listener that has been on the same check for longer than 'stuck_timeout' is only reported
+        (once per check): a replacement would run a second check of the listener at the same time
+        as the stuck one, so the listener is left to go on by itself when its check returns."""
+
+        heartbeat = self.heartbeats[name]
+        if not alive:
+            self.metrics.count("chickenbot_listener_restarts_total", listener=name)
+            heartbeat["restarts"] += 1
+            heartbeat["busy_since"] = None
+            heartbeat["stuck"] = False
+            self.error_log.write("restart", listener=name)
+            print("Warning:", utc_now(), f"restarting the {name} listener (stopped)")
+            return True
         
-        # Create threads for the listeners
-        submissions_listener = Thread(target=self.check_submissions)
-        messages_listener = Thread(target=self.private_messages)
+        busy_since = heartbeat["busy_since"]
+        if (busy_since is not None) and (time() - busy_since > self.stuck_timeout) and not heartbeat["stuck"]:
+            heartbeat["stuck"] = True
+            self.metrics.count("chickenbot_listener_stuck_total", listener=name)
+            self.error_log.write("stuck", listener=name, busy_since=busy_since)
+            print("Warning:", utc_now(), f"the {name} listener has been on the same check for {time() - busy_since:.0f} seconds")
+        return False
+    
+    def write_heartbeat(self):
+        """Rewrite the heartbeat file, if it is enabled (through a temporary file, so readers never see it half written).
+        It has the time of the watchdog's latest pass, and the heartbeat of each listener (see 'run_check()'),
+        so an external monitor can tell whether the bot is alive and still checking."""
+
+        now = time()
+        self.metrics.set("chickenbot_heartbeat_timestamp", now)
+        if self.heartbeat_file is None:
+            return
         
-        # Set the threads to 'daemoninc'
-        # (daemon threads do not prevent their parent program from exiting)
-        submissions_listener.daemon = True
-        messages_listener.daemon = True
+        heartbeat = {"time": now, "pid": getpid(), "worker": self.worker, "listeners": self.heartbeats}
+        path = Path(self.heartbeat_file)
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as heartbeat_file:
+            json.dump(heartbeat, heartbeat_file, indent=4)
+        replace(temp_path, path)
+    
+    def start_listener(self, name, check, interval, wake):
+        """Start the thread of a listener."""
 
-        # Begin the child threads
-        submissions_listener.start()
-        messages_listener.start()
+        thread = Thread(target=self.listen, args=(name, check, interval, wake), name=name)
+        thread.daemon = True    # (daemon threads do not prevent their parent program from exiting)
+        thread.start()
+        return thread
+    
+    def watchdog(self, threads, listeners):
+        """Restart the listeners whose thread has stopped, report the ones that got stuck (see 'supervise()'),
+        and write the heartbeat file. 'threads' and 'listeners' are dictionaries of the listeners' threads
+        and of their functions, by the listener's name."""
+
+        for name, thread in list(threads.items()):
+            if self.supervise(name, thread.is_alive()):
+                threads[name] = self.start_listener(name, *listeners[name])
+        self.write_heartbeat()
+    
+    def main(self):
+        """Main loop of the program"""
+        
+        # Create and begin the threads of the listeners
+        listeners = {name: (check, interval, wake) for name, check, interval, wake in self.listeners()}
+        threads = dict()
+        for name, functions in listeners.items():
+            threads[name] = self.start_listener(name, *functions)
 
         # Catch a keyboard interrupt, so the threads can terminate and the program exit
+        # Meanwhile, the watchdog keeps the listeners running
         signal(SIGINT, self.clean_exit)
         while True:
-            submissions_listener.join(1)
-            messages_listener.join(1)
+            self.watchdog(threads, listeners)
+            sleep(self.watchdog_interval)
         """NOTE
         In Python, there isn't any actual 'clean' way to terminate a thread.
         By default, a KeyboardInterrupt is caught by an arbitrary thread,
@@ -472,16 +1155,246 @@ class ChickenBot():
         Finally, the whole program exits.
         """
     
+    def main_async(self):
+        """Alternative main loop, that runs all listeners as tasks of a single asyncio event loop.
+
+        The waits between checks are asyncio sleeps, so they do not hold any thread,
+        and the bot stops immediately on SIGINT by cancelling the tasks."""
+
+        asyncio.run(self.run_listeners())
+        raise SystemExit
+    
+    async def run_listeners(self):
+        """Run the listeners as asyncio tasks until they are cancelled."""
+
+        loop = asyncio.get_running_loop()
+        listeners = {name: (check, interval, wake) for name, check, interval, wake in self.listeners()}
+        tasks = dict()
+        for name, functions in listeners.items():
+            tasks[name] = asyncio.create_task(self.listen_async(name, *functions), name=name)
+        supervisor = asyncio.create_task(self.watchdog_async(tasks, listeners))
+
+        # Cancel all listeners on a keyboard interrupt
+        def cancel_tasks():
+            self.running = False
+            supervisor.cancel()
+            for task in tasks.values():
+                task.cancel()
+        loop.add_signal_handler(SIGINT, cancel_tasks)
+
+        try:
+            await supervisor
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.remove_signal_handler(SIGINT)
+    
+    async def watchdog_async(self, tasks, listeners):
+        """Restart the listeners whose task has ended, report the ones that got stuck, and write
+        the heartbeat file (see 'watchdog()'). A stuck task is not cancelled, since its check would
+        go on in the background while the new task runs another one."""
+
+        while True:
+            for name, task in list(tasks.items()):
+                if self.supervise(name, not task.done()):
+                    tasks[name] = asyncio.create_task(self.listen_async(name, *listeners[name]), name=name)
+            self.write_heartbeat()
+            await asyncio.sleep(self.watchdog_interval)
+    
+    async def listen_async(self, name, check, interval, wake=None):
+        """Keep running a listener until its task is cancelled."""
+
+        while self.running:
+            await self.run_blocking(lambda: self.run_check(name, check))
+            self.write_metrics()
+            if wake is None:
+                await asyncio.sleep(interval())
+            else:
+                await self.pause_async(interval, wake)
+    
+    async def pause_async(self, interval, wake):
+        """Wait before the next check of a listener, on the event loop (see 'pause()').
+        The wake event is mirrored by an asyncio event, which 'wake()' sets from the other threads."""
+
+        loop, async_event = self.async_wakes.setdefault(wake, (asyncio.get_running_loop(), asyncio.Event()))
+        async_event.clear()
+        while True:
+            try:
+                await asyncio.wait_for(async_event.wait(), interval())
+            except asyncio.TimeoutError:
+                return
+            async_event.clear()
+    
+    async def run_blocking(self, function):
+        """Run a blocking function (the PRAW calls) on a daemon thread, and wait for its result.
+
+        A daemon thread is used instead of the default executor because its worker threads
+        are joined when the program exits. This way a check that is running when the bot
+        gets cancelled does not delay the exit."""
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def worker():
+            try:
+                result = function()
+            except BaseException as error:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_exception(error))
+            else:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(result))
+        
+        Thread(target=worker, daemon=True).start()
+        return await future
+    
     def clean_exit(self, *args):
         """Close the program."""
 
         self.running = False
         raise SystemExit
+    
+    def close(self):
+        """Write the pending log records, and close the saved state."""
 
+        self.log.close()
+        self.error_log.close()
+        self.state.close()
 
-if __name__ == "__main__":
+def author_id(item):
+    """User ID of the author of a post, comment or message, taken from the data that came with it
+    (so the author is not fetched from Reddit). The ID is the author's fullname without
+    the "t2_" prefix. Returns None if the item or its author was deleted.
+    
+    The attribute is read from the object's dictionary, because on a PRAW object
+    a missing attribute makes it fetch the whole object again."""
+
+    fullname = vars(item).get("author_fullname") if item is not None else None
+    return fullname[3:] if fullname else None
+
+def replies_log(shard=0, shards=1):
+    """Path of the replies log written by a shard."""
+
+    return "chickenbot_log.jsonl" if shards == 1 else f"chickenbot_log_{shard}.jsonl"
+
+def replies_logs(shards=1):
+    """Paths of all replies logs on the folder (for counting the replies): the log of a
+    single process and the logs of every shard, whatever the amount of shards they were
+    written with (including the shards whose log only has rotated files). The logs of
+    the current 'shards' are always listed, even before they exist."""
+
+    paths = {"chickenbot_log.jsonl"} | {replies_log(shard, shards) for shard in range(shards)}
+    shard_regex = re.compile(r"(chickenbot_log_\d+)\.")
+    for path in Path(".").glob("chickenbot_log_*.jsonl*"):
+        search = shard_regex.match(path.name)
+        if search is not None:
+            paths.add(f"{search.group(1)}.jsonl")
+    return sorted(paths)
+
+
+def run(engine="threads", **settings):
+    """Start a bot and run it until it is stopped.
+    It is also the entry point of each worker process, when the bot runs on several shards."""
+
+    bot = None
     try:
-        bot = ChickenBot()
-        bot.main()
+        bot = ChickenBot(**settings)
+        if engine == "async":
+            bot.main_async()
+        else:
+            bot.main()
     except (SystemExit, KeyboardInterrupt):
-        print(f"\nBot stopped running. ({bot.reply_counter} replies in total, {bot.reply_counter_session} in this session)")
+        if bot is not None:
+            bot.close()
+            print(f"\nBot stopped running. ({bot.reply_counter} replies in total, {bot.reply_counter_session} in this session)")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Reddit bot that answers why the chicken crossed the road.")
+    parser.add_argument("--verify-counter", action="store_true", help="compare the saved reply counter with the replies log, then exit")
+    parser.add_argument("--rebuild-counter", action="store_true", help="recompute the reply counter and statistics from the replies log, then exit")
+    parser.add_argument("--counter-start", type=int, default=0, help="starting value of the reply counter when recomputing it (default: 0)")
+    parser.add_argument("--stream", default=None, metavar="SUBREDDITS", help="also stream the new posts of these subreddits, joined by '+' (default: disabled)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve the metrics over HTTP on this port (default: disabled)")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads", help="run the listeners on threads or on an asyncio event loop (default: threads)")
+    parser.add_argument("--workers", type=int, default=1, help="split the queries and streamed subreddits between this many processes (default: 1)")
+    parser.add_argument("--sites", default=None, metavar="SITES", help="sections of 'praw.ini' with the account of each worker, joined by ',' (default: the same account for all)")
+    parser.add_argument("--dry-run", action="store_true", help="run without changing anything on Reddit, saving the responses to the capture file and the would-be actions to the actions file")
+    parser.add_argument("--capture", default="capture.jsonl", metavar="FILE", help="capture file of the dry run (default: capture.jsonl)")
+    parser.add_argument("--replay", default=None, metavar="CAPTURE", help="run offline on the responses of a capture file, on a virtual clock, saving the would-be actions to the actions file")
+    parser.add_argument("--actions", default="actions.jsonl", metavar="FILE", help="file of the actions not made by the dry run or replay (default: actions.jsonl)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the order of the responses on the replay (default: derived from the capture)")
+    args = parser.parse_args()
+
+    if args.verify_counter or args.rebuild_counter:
+        state = StateStore()
+        log_files = replies_logs(args.workers)
+        signatures = {path: log_signature(path) for path in log_files}
+        saved_counter = state.get("reply_counter")
+        in_sync = state.counter_in_sync(signatures)
+        if args.rebuild_counter:
+            counter = state.rebuild_reply_stats(read_replies(log_files), args.counter_start, signatures)
+            print(f"Reply counter rebuilt: {saved_counter} -> {counter}")
+        else:
+            print(f"Reply counter: {saved_counter} ({'in sync with' if in_sync else 'out of sync with'} {', '.join(log_files)})")
+        for day, subreddit, replies in state.reply_stats():
+            print(f"{day}\tr/{subreddit}\t{replies}")
+        state.close()
+        raise SystemExit
+    
+    settings = {
+        "counter_start": args.counter_start,
+        "metrics_port": args.metrics_port,
+        "stream_subreddits": args.stream,
+    }
+    if args.dry_run or (args.replay is not None):
+        # Offline runs (see 'chickenreplay')
+        from chickenreplay import dry_run, replay
+        if args.replay is not None:
+            replay(args.replay, args.actions, seed=args.seed, stream_subreddits=args.stream)
+        else:
+            dry_run(args.capture, args.actions, args.engine, **settings)
+        raise SystemExit
+    
+    if args.workers == 1:
+        run(args.engine, **settings)
+        raise SystemExit
+
+    # Each worker needs a search query or a streamed subreddit of its own, or it would sit idle
+    queries = build_queries(load_rules("rules.json", DEFAULT_QUESTION))
+    streamed = args.stream.split("+") if args.stream else []
+    if args.workers > max(len(queries), len(streamed)):
+        parser.error(
+            f"--workers {args.workers} is more than the {len(queries)} search queries and {len(streamed)} streamed "
+            "subreddits to split between them (add subreddits to --stream, or use less workers)"
+        )
+
+    # Start one process for each shard
+    # (without a separate account for each shard, only the first one checks the inbox)
+    sites = args.sites.split(",") if args.sites else [None] * args.workers
+    if len(sites) != args.workers:
+        parser.error("--sites must have one site for each worker")
+    
+    processes = []
+    for shard, site in enumerate(sites):
+        worker_settings = dict(
+            settings,
+            shard = shard,
+            shards = args.workers,
+            site = site,
+            inbox = (shard == 0) or (site is not None),
+            metrics_file = f"metrics_{shard}.prom",
+            heartbeat_file = f"heartbeat_{shard}.json",
+            metrics_port = None if args.metrics_port is None else args.metrics_port + shard,
+        )
+        processes.append(Process(target=run, args=(args.engine,), kwargs=worker_settings, name=f"ChickenBot {shard}"))
+    
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # The workers get the interrupt too, and stop on their own
+        for process in processes:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
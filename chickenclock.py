@@ -0,0 +1,63 @@
+"""Clock used by the bot for the current time and for the waits.
+
+The bot's modules take the time from here, instead of from the 'time' module,
+so the clock can be replaced. For example, when replaying captured traffic
+(see 'chickenreplay'), a virtual clock makes the hours of waiting pass instantly.
+"""
+
+import time as system_time
+from datetime import datetime, timezone
+from threading import Lock
+
+class SystemClock():
+    """The real time."""
+
+    def time(self):
+        return system_time.time()
+
+    def sleep(self, seconds):
+        system_time.sleep(seconds)
+
+class VirtualClock():
+    """Clock whose time only passes when the bot waits (or when it is moved forward).
+    A wait returns immediately, after moving the clock forward by its duration."""
+
+    def __init__(self, start):
+        self.now = start    # Current virtual time (Unix epoch)
+        self.lock = Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += max(seconds, 0)
+
+    def advance_to(self, moment):
+        """Move the clock forward to a moment (a clock never goes back)."""
+
+        with self.lock:
+            self.now = max(self.now, moment)
+
+clock = SystemClock()   # Clock in use
+
+def set_clock(new_clock):
+    """Replace the clock in use."""
+
+    global clock
+    clock = new_clock
+
+def time():
+    """Current time (Unix epoch) of the clock in use."""
+
+    return clock.time()
+
+def sleep(seconds):
+    """Wait for some seconds on the clock in use."""
+
+    clock.sleep(seconds)
+
+def utc_now():
+    """Current UTC date and time as text (without the fractional part of the seconds)."""
+
+    return str(datetime.fromtimestamp(clock.time(), timezone.utc))[:19]
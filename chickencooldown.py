@@ -0,0 +1,62 @@
+from heapq import heappush, heappop, heapify
+from chickenclock import time
+
+class CooldownIndex():
+    """Users who are on cooldown (who recently got a reply from the bot), and when their cooldown expires.
+
+    The expiry times are Unix epoch seconds. They are kept on a dictionary, for checking
+    a user in constant time, and on a min-heap ordered by expiry, so the expired users
+    can be removed without scanning all the users.
+
+    When a user gets a new cooldown, the old entry stays on the heap and is just skipped
+    when it comes out. The heap is rebuilt from the dictionary if those stale entries
+    grow too much, so the memory stays proportional to the amount of users.
+    """
+
+    def __init__(self):
+        self.expiries = dict()  # User ID: expiry time
+        self.heap = []          # (expiry time, user ID), the earliest expiry on the top
+
+    def add(self, user, expires_at):
+        """Put a user on cooldown until the given time."""
+
+        self.expiries[user] = expires_at
+        heappush(self.heap, (expires_at, user))
+
+        # Remove the stale entries when they are more than half of the heap
+        if len(self.heap) > 2 * len(self.expiries) + 16:
+            self.heap = [(expiry, user) for user, expiry in self.expiries.items()]
+            heapify(self.heap)
+
+    def __contains__(self, user):
+        """Whether the user is still on cooldown."""
+
+        expires_at = self.expiries.get(user)
+        return (expires_at is not None) and (expires_at > time())
+
+    def __len__(self):
+        return len(self.expiries)
+
+    def expiry(self, user):
+        """When the user's cooldown expires (None if the user is not on the index)."""
+
+        return self.expiries.get(user)
+
+    def items(self):
+        """Pairs of user ID and expiry time."""
+
+        return self.expiries.items()
+
+    def expire(self, now=None):
+        """Remove the users whose cooldown has expired. Returns the list of removed users."""
+
+        if now is None:
+            now = time()
+
+        expired = []
+        while self.heap and (self.heap[0][0] <= now):
+            expires_at, user = heappop(self.heap)
+            if self.expiries.get(user) == expires_at:  # Skip the stale entries
+                del self.expiries[user]
+                expired.append(user)
+        return expired
@@ -0,0 +1,238 @@
+"""Structured logs of the bot (replies, refused replies, errors), as JSON lines.
+
+Each record is a JSON object on its own line, with at least the UTC time and the kind of event:
+    {"time": "2024-01-31 12:00:00", "kind": "reply", "user": "someone", ...}
+
+The records are put on a queue and written in batches by a background thread,
+so the bot's threads never wait for the disk. When the log file gets too big or
+too old, it is compressed with gzip and a new file is started.
+
+The logs can also be queried from the command line:
+    python chickenlog.py [--log FILE] [--kind KIND] [--since DATE] [--until DATE] [--user NAME] [--subreddit NAME] [--count]
+"""
+
+import gzip
+import json
+import re
+import shutil
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from os import replace
+from pathlib import Path
+from queue import Queue, Empty
+from threading import Thread
+from chickenclock import time, utc_now
+
+class EventLog():
+    """Log file written on the background, with rotation and compression.
+
+    The rotated files are named after the log and the time of the rotation,
+    for example 'chickenbot_log.20240131-120000-000000.jsonl.gz'. Only the latest
+    'backups' rotated files are kept (or all of them, if it is None).
+
+    'on_flush' is called from the writer thread after each batch is written,
+    with the log's signature (see 'signature()') and the records of the batch.
+    """
+
+    def __init__(self, path="chickenbot_log.jsonl", max_bytes=4*1024*1024, max_age=30*86400, backups=None, batch_size=100, on_flush=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes      # Size in bytes for rotating the file
+        self.max_age = max_age          # Age in seconds of the first record for rotating the file
+        self.backups = backups          # Amount of rotated files to keep (None to keep all)
+        self.batch_size = batch_size    # Most records written at once
+        self.on_flush = on_flush
+        self.started = None             # Time of the first record on the current file (Unix epoch)
+
+        self.queue = Queue()
+        self.thread = Thread(target=self.writer, daemon=True, name=f"log {self.path.name}")
+        self.thread.start()
+
+    def write(self, kind, **fields):
+        """Add a record to the log. It returns immediately (the record is written on the background)."""
+
+        self.queue.put({"time": utc_now(), "kind": kind, **fields})
+
+    def flush(self):
+        """Wait until all queued records have been written."""
+
+        self.queue.join()
+
+    def close(self):
+        """Write the queued records and stop the writer thread."""
+
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def writer(self):
+        """Loop of the writer thread: take the queued records in batches and append them to the file."""
+
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            # An error is reported without stopping the thread, so the later records are still written
+            # (and 'flush()' does not wait forever)
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    self.write_batch(records)
+            except Exception as error:
+                print("Warning: could not write to the log:", self.path, error)
+            finally:
+                for record in batch:
+                    self.queue.task_done()
+
+            if len(records) < len(batch):   # None was queued by 'close()'
+                return
+
+    def write_batch(self, records):
+        if self.should_rotate():
+            self.rotate()
+
+        text = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(self.path, "a", encoding="utf-8") as log_file:
+            log_file.write(text)
+        if self.started is None:
+            self.started = time()
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush(self.signature(), records)
+            except Exception as error:     # (e.g. the database was locked by another process for too long)
+                print("Warning: could not record the writing of the log:", self.path, error)
+
+    def should_rotate(self):
+        """Whether the current file is over the maximum size or age."""
+
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return False
+        if size == 0:
+            return False
+        if size >= self.max_bytes:
+            return True
+
+        if self.started is None:
+            self.started = first_record_time(self.path)
+        return time() - self.started >= self.max_age
+
+    def rotate(self):
+        """Compress the current file, and remove the oldest rotated files beyond 'backups'."""
+
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}.gz")
+        temp_path = rotated.with_suffix(".tmp")
+        with open(self.path, "rb") as source, gzip.open(temp_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        replace(temp_path, rotated)
+        self.path.unlink()
+        self.started = None
+
+        if self.backups is not None:
+            old_files = rotated_files(self.path)
+            for old_file in old_files[:max(len(old_files) - self.backups, 0)]:
+                old_file.unlink()
+
+    def signature(self):
+        """Identifies the current contents of the log: the size of the current file
+        and the name of the latest rotated file (so the bot can tell whether the
+        log was changed by something else)."""
+
+        return log_signature(self.path)
+
+def rotated_files(path):
+    """Rotated files of a log, from the oldest to the newest."""
+
+    path = Path(path)
+    return sorted(path.parent.glob(f"{path.stem}.*{path.suffix}.gz"))
+
+def log_signature(path):
+    """Size of the log's current file and name of its latest rotated file (see 'EventLog.signature()')."""
+
+    path = Path(path)
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        size = 0
+    rotated = rotated_files(path)
+    return [size, rotated[-1].name if rotated else None]
+
+def first_record_time(path):
+    """Time of the first record of a log file (Unix epoch), or the current time if it cannot be read."""
+
+    try:
+        with open(path, "r", encoding="utf-8") as log_file:
+            record = json.loads(log_file.readline())
+        return datetime.fromisoformat(record["time"]).replace(tzinfo=timezone.utc).timestamp()
+    except (OSError, ValueError, KeyError, TypeError):
+        return time()
+
+def read_records(path, kind=None):
+    """Generator of the records of a log, from the oldest (including the rotated files).
+    Lines that are not valid JSON (e.g. cut by a crash) are skipped."""
+
+    path = Path(path)
+    files = rotated_files(path) + ([path] if path.exists() else [])
+    for log_path in files:
+        opener = gzip.open if log_path.suffix == ".gz" else open
+        with opener(log_path, "rt", encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if (kind is None) or (record.get("kind") == kind):
+                    yield record
+
+def read_replies(paths, legacy_path="chickenbot_log.txt"):
+    """Generator of (day, subreddit) of each reply made by the bot, from the logs.
+
+    The replies logged by older versions of the bot, on the tab separated text
+    file 'legacy_path', come first. Each of its lines is: date and time, username,
+    link to the bot's comment."""
+
+    subreddit_regex = re.compile(r"/r/(\w+)/")
+    try:
+        with open(legacy_path, "r", encoding="utf-8") as log_file:
+            for line in log_file:
+                if not line.strip(): continue   # Do not count blank lines
+                search = subreddit_regex.search(line)
+                yield (line[:10], search.group(1) if search else "")
+    except FileNotFoundError:
+        pass
+
+    for path in paths:
+        for record in read_records(path, kind="reply"):
+            yield (record["time"][:10], record.get("subreddit", ""))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Show the records of ChickenBot's logs.")
+    parser.add_argument("--log", default="chickenbot_log.jsonl", help="log file, its rotated files are also read (default: chickenbot_log.jsonl)")
+    parser.add_argument("--kind", default=None, help="only records of this kind, e.g. reply, forbidden, failed, error (default: all)")
+    parser.add_argument("--since", default="", metavar="DATE", help="only records at or after this UTC date/time, e.g. 2024-01-31")
+    parser.add_argument("--until", default=None, metavar="DATE", help="only records before this UTC date/time")
+    parser.add_argument("--user", default=None, help="only records about this user")
+    parser.add_argument("--subreddit", default=None, help="only records on this subreddit")
+    parser.add_argument("--count", action="store_true", help="show the amount of records of each kind, instead of the records")
+    args = parser.parse_args()
+
+    counts = dict()
+    for record in read_records(args.log, args.kind):
+        if record["time"] < args.since: continue
+        if (args.until is not None) and (record["time"] >= args.until): continue
+        if (args.user is not None) and (record.get("user", "").lower() != args.user.lower()): continue
+        if (args.subreddit is not None) and (record.get("subreddit", "").lower() != args.subreddit.lower()): continue
+
+        if args.count:
+            counts[record["kind"]] = counts.get(record["kind"], 0) + 1
+        else:
+            print(json.dumps(record, ensure_ascii=False))
+
+    for kind, amount in sorted(counts.items()):
+        print(f"{kind}\t{amount}")
@@ -0,0 +1,158 @@
+"""Metrics of the bot's operation (durations, counts, API usage), in the Prometheus text format.
+
+The metrics can be periodically written to a file ('Metrics.write()') and/or served
+over HTTP ('Metrics.serve()'), so a monitoring system can collect them."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from os import getpid, replace
+from pathlib import Path
+from threading import Thread, Lock, get_ident
+from time import perf_counter
+from prawcore import Requestor
+
+class Metrics():
+    """Thread-safe collection of counters, gauges and summaries.
+
+    Each metric is identified by its name and its labels (keyword arguments), for example:
+        metrics.count("chickenbot_posts_filtered_total", reason="blacklisted")
+    Summaries keep the count, sum and maximum of the observed values (e.g. durations in seconds).
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counters = dict()
+        self.gauges = dict()
+        self.summaries = dict()     # Values are lists of: [count, sum, max]
+        self.descriptions = dict()
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def describe(self, name, description):
+        """Set the help text of a metric."""
+
+        self.descriptions[name] = description
+
+    def count(self, name, amount=1, **labels):
+        """Increase a counter."""
+
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """Set the value of a gauge."""
+
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Add a value to a summary."""
+
+        key = self.key(name, labels)
+        with self.lock:
+            summary = self.summaries.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Context manager that adds to a summary the time in seconds spent inside it."""
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def get(self, name, **labels):
+        """Current value of a counter or gauge (0 if it was never set)."""
+
+        key = self.key(name, labels)
+        with self.lock:
+            return self.counters.get(key, self.gauges.get(key, 0))
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+
+        def labels_text(labels, extra=()):
+            labels = list(labels) + list(extra)
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}"
+
+        lines = []
+        with self.lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges), ("summary", self.summaries)):
+                declared = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    if name not in declared:
+                        declared.add(name)
+                        if name in self.descriptions:
+                            lines.append(f"# HELP {name} {self.descriptions[name]}")
+                        lines.append(f"# TYPE {name} {kind}")
+                    if kind == "summary":
+                        count, total, maximum = value
+                        lines.append(f"{name}_count{labels_text(labels)} {count}")
+                        lines.append(f"{name}_sum{labels_text(labels)} {total}")
+                        lines.append(f"{name}_max{labels_text(labels)} {maximum}")
+                    else:
+                        lines.append(f"{name}{labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path="metrics.prom"):
+        """Rewrite the metrics file (through a temporary file, so readers never see it half written).
+        Each write has its own temporary file, so several threads can write the metrics at the same time."""
+
+        path = Path(path)
+        temp_path = path.with_name(f"{path.name}.{getpid()}.{get_ident()}.tmp")    # (named after the process and thread)
+        try:
+            with open(temp_path, "w", encoding="utf-8") as metrics_file:
+                metrics_file.write(self.render())
+            replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the metrics over HTTP on a background thread (any path returns the metrics)."""
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+class CountingRequestor(Requestor):
+    """PRAW requestor that counts the HTTP requests made to Reddit, their duration and size.
+
+    Usage:
+        praw.Reddit(requestor_class=CountingRequestor, requestor_kwargs={"metrics": metrics})
+    """
+
+    def __init__(self, *args, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    def request(self, *args, **kwargs):
+        method = (args[0] if args else kwargs.get("method", "")).upper()
+        with self.metrics.timer("chickenbot_api_request_seconds", method=method):
+            response = super().request(*args, **kwargs)
+        self.metrics.count("chickenbot_api_requests_total", method=method, status=f"{response.status_code // 100}xx")
+        self.metrics.count("chickenbot_api_received_bytes_total", len(response.content))
+        return response
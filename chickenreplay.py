@@ -0,0 +1,300 @@
+"""Offline runs of the bot, which never change anything on Reddit.
+
+Dry run ('python chickenbot.py --dry-run'):
+    The bot runs on the live Reddit, but the requests that would change something
+    (replies, deletions, messages, marking as read) are not sent. Instead, they are
+    written to the actions log. The responses of all other requests are saved to
+    the capture file.
+
+Replay ('python chickenbot.py --replay CAPTURE'):
+    The bot runs on the responses of the capture file, without connecting to Reddit,
+    on a virtual clock that skips the waits. So days of captured traffic are processed
+    in seconds. The actions that the bot would have made are written to the actions
+    log, where they can be compared between two versions of the bot.
+
+    The listeners take turns on a single thread, instead of running at the same
+    time, so a replay always makes the same decisions on the same capture (which
+    may differ slightly from the decisions of the dry run that captured it).
+
+The replay needs no Reddit credentials: the settings missing from 'praw.ini' get
+placeholders. The order of the responses is drawn from a fixed seed (by default,
+derived from the capture), so replaying the same capture twice gives the same actions.
+
+Both runs happen on a temporary folder with a copy of the bot's input files (responses,
+rules, blacklist, 'praw.ini'), starting from an empty state. So they do not touch the
+bot's saved state or logs, and a replay starts from the same state as its capture.
+
+The capture file is a log of JSON lines (see 'chickenlog'). A response that is the
+same as the previous response of the same request is stored without its body.
+"""
+
+import json
+import shutil
+from contextlib import contextmanager
+from hashlib import blake2b
+from os import chdir, getcwd
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from urllib.parse import urlsplit
+from time import perf_counter
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from chickenclock import VirtualClock, set_clock, time
+from chickenlog import EventLog, read_records
+from chickenmetrics import CountingRequestor
+
+INPUT_FILES = ("responses.txt", "rules.json", "blacklist.txt", "praw.ini")
+PLACEHOLDER_SETTINGS = {    # Reddit settings used by the replay when they are not on 'praw.ini'
+    "client_id": "replay", "client_secret": "replay", "username": "ChickenRoad_Bot",
+    "password": "replay", "user_agent": "ChickenBot replay",
+}
+
+def request_key(method, url, params):
+    """Identifies a request by its method, path and parameters."""
+
+    params = params.items() if isinstance(params, dict) else (params or [])
+    return json.dumps([method.upper(), urlsplit(url).path, sorted((str(key), str(value)) for key, value in params)])
+
+def make_response(url, status, body):
+    """Build a 'requests' response, as if it came from Reddit."""
+
+    response = Response()
+    response.status_code = status
+    response._content = body.encode("utf-8")
+    response.headers = CaseInsensitiveDict({"content-type": "application/json; charset=UTF-8"})
+    response.encoding = "utf-8"
+    response.url = url
+    return response
+
+class OfflineRequestor(CountingRequestor):
+    """PRAW requestor that does not send the requests that change something on Reddit.
+    Those requests get a made up response, and are written to the actions log.
+
+    The messages marked as read are also shown as read on the later lists of
+    messages, as Reddit would have done."""
+
+    actions_by_path = {
+        "/api/comment": "reply",
+        "/api/del": "delete",
+        "/api/compose": "message",
+        "/api/read_message": "mark_read",
+        "/api/editusertext": "edit",
+    }
+
+    def __init__(self, *args, actions=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.actions = actions      # 'EventLog' of the actions not sent to Reddit
+        self.read_messages = set()  # Fullnames of the messages marked as read
+        self.comment_number = 0     # Used to make up the IDs of the bot's comments
+
+    def request(self, *args, **kwargs):
+        method = (args[0] if args else kwargs.get("method", "")).upper()
+        url = args[1] if len(args) > 1 else kwargs.get("url", "")
+        path = urlsplit(url).path.rstrip("/")
+
+        if path.endswith("/access_token"):
+            return self.authenticate(*args, **kwargs)
+        if method != "GET":
+            self.metrics.count("chickenbot_api_requests_total", method=method, status="offline")
+            return self.intercept(url, path, dict(kwargs.get("data") or []))
+
+        response = self.fetch(request_key(method, url, kwargs.get("params")), url, args, kwargs)
+        if path == "/message/messages" and self.read_messages and response.status_code == 200:
+            listing = response.json()
+            for child in listing["data"]["children"]:
+                if child["data"].get("name") in self.read_messages:
+                    child["data"]["new"] = False
+            response = make_response(url, 200, json.dumps(listing))
+        return response
+
+    def authenticate(self, *args, **kwargs):
+        return super().request(*args, **kwargs)
+
+    def fetch(self, key, url, args, kwargs):
+        """Get the response of a read request ('key' identifies the request, see 'request_key()')."""
+
+        return super().request(*args, **kwargs)
+
+    def intercept(self, url, path, data):
+        """Log a request that would change something on Reddit, and make up its response."""
+
+        action = self.actions_by_path.get(path, path)
+        if self.actions is not None:
+            self.actions.write(action, **data)
+        print("DRY RUN:", action, " ".join(f"{key}={value}" for key, value in data.items() if key in ("thing_id", "id", "to")))
+
+        body = {"json": {"errors": []}}
+        if path == "/api/read_message":
+            self.read_messages.update(data.get("id", "").split(","))
+            body = {}
+        elif path == "/api/del":
+            body = {}
+        elif path == "/api/comment":
+            self.comment_number += 1
+            comment_id = f"offline{self.comment_number}"
+            parent = data.get("thing_id", "")
+            post_id = parent[3:] if parent.startswith("t3_") else ""
+            body["json"]["data"] = {"things": [{"kind": "t1", "data": {
+                "id": comment_id, "name": f"t1_{comment_id}", "body": data.get("text", ""),
+                "parent_id": parent, "link_id": f"t3_{post_id}",
+                "permalink": f"/comments/{post_id}/_/{comment_id}/", "created_utc": time(),
+            }}]}
+        return make_response(url, 200, json.dumps(body))
+
+class CaptureRequestor(OfflineRequestor):
+    """Requestor of the dry run: the read requests go to Reddit, and their responses are saved to the capture."""
+
+    def __init__(self, *args, capture=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.capture = capture      # 'EventLog' of the captured responses
+        self.last_hashes = dict()   # Request key: hash of the latest response's body
+
+    def fetch(self, key, url, args, kwargs):
+        response = super().fetch(key, url, args, kwargs)
+        body = response.text
+        digest = blake2b(response.content, digest_size=16).hexdigest()
+        record = {"t": time(), "key": key, "status": response.status_code}
+        if self.last_hashes.get(key) != digest:
+            record["body"] = body
+            self.last_hashes[key] = digest
+        self.capture.write("response", **record)
+        return response
+
+class ReplayRequestor(OfflineRequestor):
+    """Requestor of the replay: the read requests get the captured responses, without connecting to Reddit.
+
+    Each request gets the latest response captured for it up to the current (virtual)
+    time, or its earliest response if it was only captured later. A request that was
+    never captured gets an empty listing."""
+
+    def __init__(self, *args, responses=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.responses = responses or dict()   # Request key: list of (time, status, body), sorted by time
+
+    def authenticate(self, *args, **kwargs):
+        url = args[1] if len(args) > 1 else kwargs.get("url", "")
+        token = {"access_token": "replay", "token_type": "bearer", "expires_in": 86400, "scope": "*"}
+        return make_response(url, 200, json.dumps(token))
+
+    def fetch(self, key, url, args, kwargs):
+        self.metrics.count("chickenbot_api_requests_total", method="GET", status="replayed")
+        captured = self.responses.get(key)
+        if not captured:
+            return make_response(url, 200, json.dumps({"kind": "Listing", "data": {"after": None, "before": None, "children": []}}))
+
+        now = time()
+        moment, status, body = captured[0]
+        for item in captured:
+            if item[0] > now:
+                break
+            moment, status, body = item
+        return make_response(url, status, body)
+
+def load_capture(path):
+    """Read a capture file. Returns the responses by request (see 'ReplayRequestor'),
+    and the time of the first and last responses."""
+
+    responses = dict()
+    last_bodies = dict()
+    first = last = None
+    for record in read_records(path, kind="response"):
+        key = record["key"]
+        body = record.get("body", last_bodies.get(key, ""))
+        last_bodies[key] = body
+        responses.setdefault(key, []).append((record["t"], record["status"], body))
+        first = record["t"] if first is None else min(first, record["t"])
+        last = record["t"] if last is None else max(last, record["t"])
+    for captured in responses.values():
+        captured.sort(key=lambda item: item[0])
+    return responses, first, last
+
+def offline_settings(site=None):
+    """Placeholders for the Reddit settings that are missing from 'praw.ini', so the
+    Reddit instance of the replay can be created without real credentials."""
+
+    import praw
+
+    config = praw.config.Config(site or "DEFAULT")
+    return {
+        key: value for key, value in PLACEHOLDER_SETTINGS.items()
+        if getattr(config, key, None) in (None, config.CONFIG_NOT_SET)
+    }
+
+@contextmanager
+def offline_folder():
+    """Run on a temporary folder with a copy of the bot's input files."""
+
+    previous_folder = getcwd()
+    with TemporaryDirectory() as folder:
+        for file_name in INPUT_FILES:
+            if Path(file_name).exists():
+                shutil.copy(file_name, folder)
+        chdir(folder)
+        try:
+            yield folder
+        finally:
+            chdir(previous_folder)
+
+def dry_run(capture_path, actions_path, engine="threads", **settings):
+    """Run the bot on the live Reddit without changing anything, and capture the responses."""
+
+    import praw
+    import chickenbot
+    from chickenmetrics import Metrics
+
+    capture_path = Path(capture_path).resolve()
+    actions_path = Path(actions_path).resolve()
+    metrics = Metrics()
+    capture = EventLog(capture_path, max_bytes=64*1024*1024)
+    actions = EventLog(actions_path)
+
+    with offline_folder():
+        reddit = praw.Reddit(
+            settings.pop("site", None),
+            requestor_class = CaptureRequestor,
+            requestor_kwargs = {"metrics": metrics, "capture": capture, "actions": actions},
+        )
+        chickenbot.run(engine, reddit=reddit, metrics=metrics, metrics_file=None, **settings)
+
+    capture.close()
+    actions.close()
+    print(f"Captured responses saved to: {capture_path}\nActions saved to: {actions_path}")
+
+def replay(capture_path, actions_path, seed=None, **settings):
+    """Run the bot on the responses of a capture file, on a virtual clock.
+    'seed' is the seed for the order of the responses (by default, the time of the capture's first response)."""
+
+    import praw
+    import chickenbot
+    from chickenmetrics import Metrics
+
+    responses, first, last = load_capture(Path(capture_path).resolve())
+    if first is None:
+        raise SystemExit(f"There are no responses on the capture file '{capture_path}'")
+
+    actions_path = Path(actions_path).resolve()
+    metrics = Metrics()
+    actions = EventLog(actions_path)
+    set_clock(VirtualClock(first))
+
+    start = perf_counter()
+    with offline_folder():
+        site = settings.pop("site", None)
+        reddit = praw.Reddit(
+            site,
+            requestor_class = ReplayRequestor,
+            requestor_kwargs = {"metrics": metrics, "responses": responses, "actions": actions},
+            **offline_settings(site),
+        )
+        seed = seed if seed is not None else int(first)
+        bot = chickenbot.ChickenBot(reddit=reddit, metrics=metrics, metrics_file=None, heartbeat_file=None, seed=seed, **settings)
+        bot.simulate(until=last)
+        bot.close()
+    elapsed = perf_counter() - start
+    actions.close()
+
+    hours = (last - first) / 3600
+    scanned = sum(metrics.get("chickenbot_posts_scanned_total", source=source) for source in ("search", "stream"))
+    print(f"\nReplayed {hours:.1f} hours of traffic in {elapsed:.1f} seconds ({scanned / max(elapsed, 1e-9):.0f} posts per second)")
+    print(f"{metrics.get('chickenbot_replies_total')} replies, {metrics.get('chickenbot_removal_requests_total')} removal requests")
+    print(f"Actions saved to: {actions_path}")
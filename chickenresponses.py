@@ -0,0 +1,174 @@
+from bisect import bisect_right
+from hashlib import blake2b
+from os import urandom
+from pathlib import Path
+from random import Random
+from threading import Lock
+
+class ResponsePool():
+    """Gives the responses from a text file (one per line) in a random order, without
+    repeating a response until all others have been used.
+
+    The random order is not stored. Instead, each response has a sorting key that
+    is the hash of the response's text together with a random seed, and the responses
+    are used in the order of their keys. So the saved state is only the seed and the
+    key of the last used response (the cursor), which are stored on the 'StateStore'.
+
+    Since the key of a response depends only on its own text, editing the file does
+    not change the position of the other responses: the new responses with a key after
+    the cursor are used on the current round, and the others on the next round. When
+    the round ends, a new seed is drawn, which shuffles the order for the next round.
+
+    The file is not kept in memory, only the key, offset and length of each line.
+    The index is rebuilt when the file's size or modification time changes.
+
+    The seed and cursor are read and updated on a single transaction for each
+    response, so several bot processes can share the same pool.
+
+    The seeds are random, unless 'seed' is given: then the same rounds are drawn
+    every time (so a replay of captured traffic always picks the same responses).
+
+    A queue of responses saved by older versions of the bot can be imported with
+    'import_queue()'. Its responses are used first, before the pool's own order.
+    """
+
+    read_attempts = 3   # Times a response is read before giving up, if the file keeps changing meanwhile
+
+    def __init__(self, state, path="responses.txt", name="responses", seed=None):
+        self.state = state
+        self.path = Path(path)
+        self.name = name            # Key of the pool on the saved state
+        self.rng = Random(f"{seed}:{name}") if seed is not None else None  # Draws the seeds of the rounds (None for random seeds)
+        self.lock = Lock()
+        self.file_version = None    # Size and modification time of the indexed file
+        self.keys = []              # Sorting keys of the responses, in order
+        self.lines = []             # (offset, length) of each response, in the same order as the keys
+
+        self.seed = None
+        self.cursor = -1
+        self.queue = []             # Responses left from an imported queue (used from the end)
+        self.response = None        # Response taken by the latest call of 'next()'
+        self.load(self.state.get(self.name))
+
+    def load(self, saved):
+        """Use the seed and cursor from the saved state (or start a new round if there is none)."""
+
+        if not isinstance(saved, dict):
+            self.new_round()
+            self.queue = []
+            return
+        
+        seed = bytes.fromhex(saved["seed"])
+        if seed != self.seed:
+            self.seed = seed
+            self.file_version = None    # The keys change along with the seed
+        self.cursor = saved["cursor"]
+        self.queue = saved.get("queue", [])
+
+    def new_round(self):
+        """Draw a new seed and reset the cursor to the beginning."""
+
+        self.seed = urandom(8) if self.rng is None else self.rng.randbytes(8)
+        self.cursor = -1
+        self.file_version = None    # The keys change along with the seed
+
+    def import_queue(self, responses):
+        """Add a queue of responses saved by an older version of the bot (a list that was used from
+        its end). They are used before the pool's own order, and then the queue is dropped."""
+
+        def add_queue(saved):
+            self.load(saved)
+            self.queue = [response for response in responses if response.strip()] + self.queue
+            return self.saved()
+        
+        with self.lock:
+            self.state.update(self.name, add_queue)
+
+    def saved(self):
+        """The seed, cursor and queue to be saved on the state."""
+
+        saved = {"seed": self.seed.hex(), "cursor": self.cursor}
+        if self.queue:
+            saved["queue"] = self.queue
+        return saved
+
+    def sort_key(self, line):
+        return int.from_bytes(blake2b(line, digest_size=8, key=self.seed).digest(), "big")
+
+    def update_index(self):
+        """Rebuild the index of the responses if the file has changed."""
+
+        stat = self.path.stat()
+        version = (stat.st_size, stat.st_mtime_ns)
+        if version == self.file_version:
+            return
+
+        index = []
+        offset = 0
+        with open(self.path, "rb") as responses_file:
+            for line in responses_file:
+                text = line.strip()
+                if text:
+                    index.append((self.sort_key(text), offset, len(line)))
+                offset += len(line)
+        index.sort()
+
+        self.keys = [key for key, offset, length in index]
+        self.lines = [(offset, length) for key, offset, length in index]
+        self.file_version = version
+
+    def read_line(self, position):
+        """Read the response at a position of the index.
+        Returns None if the file has changed since the index was built."""
+
+        offset, length = self.lines[position]
+        with open(self.path, "rb") as responses_file:
+            responses_file.seek(offset)
+            text = responses_file.read(length).strip()
+        if self.sort_key(text) != self.keys[position]:
+            return None
+        return text.decode("utf-8")
+
+    def __len__(self):
+        with self.lock:
+            self.update_index()
+            return len(self.keys)
+
+    def next(self):
+        """Get the next response, and save the new cursor."""
+
+        with self.lock:
+            self.state.update(self.name, self.advance)
+            return self.response
+
+    def advance(self, saved):
+        """Move the cursor to the next response (which is stored on 'self.response').
+        Returns the new seed and cursor to be saved (and what is left of an imported queue)."""
+
+        self.load(saved)
+        if self.queue:
+            self.response = self.queue.pop()
+            return self.saved()
+
+        for attempt in range(self.read_attempts + 1):  # (plus the start of a new round)
+            self.update_index()
+            if not self.keys:
+                raise ValueError(f"There are no responses on '{self.path}'")
+
+            # Start a new round once all responses have been used
+            position = bisect_right(self.keys, self.cursor)
+            if position == len(self.keys):
+                self.new_round()
+                continue
+
+            # Read the response (if the file has changed meanwhile, read it again after updating the index)
+            response = self.read_line(position)
+            if response is not None:
+                break
+            self.file_version = None
+        else:
+            raise ValueError(f"'{self.path}' kept changing while reading a response")
+
+        self.cursor = self.keys[position]
+        self.response = response
+        return self.saved()
@@ -0,0 +1,55 @@
+"""Retries of the operations that fail because of a temporary problem."""
+
+import random
+from prawcore.exceptions import RequestException, ServerError, TooManyRequests
+from chickenclock import sleep
+
+class RetryPolicy():
+    """Runs an operation again when it fails because of a temporary problem: network
+    errors, Reddit's server errors (HTTP 5xx) and rate limiting (HTTP 429). Other
+    errors (e.g. a refused reply) are raised right away, since retrying would not help.
+
+    The waits between the attempts grow exponentially from 'base_delay' up to
+    'max_delay' seconds, and each one is randomized between half and all of its
+    value (jitter), so several bot processes do not retry all at the same time.
+    They are independent of the listeners' polling intervals: a search that fails
+    is tried again within seconds, instead of on the next search cycle.
+    """
+
+    transient = (RequestException, ServerError, TooManyRequests)   # Errors worth retrying
+
+    def __init__(self,
+        attempts = 4,       # Most times an operation is run (including the first)
+        base_delay = 5,     # Wait in seconds before the first retry
+        max_delay = 300,    # Longest wait in seconds before a retry
+        metrics = None,     # Metrics where the retries are counted (None to disable)
+        rng = None,         # Random number generator for the jitter (by default, the 'random' module)
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = metrics
+        self.rng = rng if rng is not None else random
+
+    def delay(self, retry):
+        """Time in seconds to wait before a retry (counted from 0)."""
+
+        ceiling = min(self.base_delay * 2 ** retry, self.max_delay)
+        return self.rng.uniform(ceiling / 2, ceiling)
+
+    def call(self, function, operation="operation"):
+        """Run a function (without arguments), retrying it on the temporary errors.
+        Returns its result, or raises its error after the last attempt.
+        'operation' names it on the warnings and on the metrics."""
+
+        for retry in range(self.attempts):
+            try:
+                return function()
+            except self.transient as error:
+                if retry == self.attempts - 1:
+                    raise
+                delay = self.delay(retry)
+                if self.metrics is not None:
+                    self.metrics.count("chickenbot_retries_total", operation=operation)
+                print(f"Warning: {operation} failed ({error}), retrying in {delay:.0f} seconds")
+                sleep(delay)
@@ -0,0 +1,89 @@
+import json
+import re
+from pathlib import Path
+
+class Rule():
+    """A question that the bot answers, and how it answers it.
+
+    The rules are read from a JSON file with a list of objects, for example:
+        [{
+            "name": "chicken",                                  # Unique name of the rule
+            "question": "why did the chicken cross the road",   # Text that must be on the post's title
+            "responses": "responses.txt",                       # File with the answers (one per line)
+            "header": ">Why did the chicken cross the road?",   # Optional: text quoted before the answer
+            "footer": "...{counter}...",                        # Optional: text after the answer ({counter} is the reply counter)
+            "cooldown": 86400                                   # Optional: seconds before the same user can get another reply
+        }]
+    """
+
+    default_footer = "^(This is an automatic comment made by a bot, who has answered so far to {counter} doubts concerning gallinaceous roadgoing birds.)"
+
+    def __init__(self, name, question, responses="responses.txt", header=None, footer=None, cooldown=None):
+        self.name = name
+        self.question = question.lower()
+        self.responses = responses
+        self.header = header if header is not None else f">{question[:1].upper()}{question[1:]}?"
+        self.footer = footer if footer is not None else self.default_footer
+        self.cooldown = cooldown    # None means the bot's default cooldown
+
+    @property
+    def query(self):
+        """Search query for the question."""
+
+        return f"(title:{self.question})"
+
+def load_rules(path, default_question):
+    """Read the rules from a JSON file. If the file does not exist, there is a single
+    rule for the given question (the bot's original chicken question)."""
+
+    path = Path(path)
+    if not path.exists():
+        return [Rule("chicken", default_question, header=">Why did the chicken cross the road?")]
+
+    with open(path, "r", encoding="utf-8") as rules_file:
+        rules = [Rule(**rule) for rule in json.load(rules_file)]
+
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names):
+        raise ValueError(f"The rule names on '{path}' must be unique")
+    if not rules:
+        raise ValueError(f"There are no rules on '{path}'")
+    return rules
+
+class RuleMatcher():
+    """Finds which rule's question is on a title, with a single regular expression
+    that has all questions as alternatives (so each title is scanned only once)."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        # Longer questions first, so a question that contains another one takes precedence
+        ordered = sorted(range(len(rules)), key=lambda number: -len(rules[number].question))
+        self.regex = re.compile("|".join(
+            f"(?P<rule{number}>{re.escape(rules[number].question)})" for number in ordered
+        ))
+
+    def match(self, title):
+        """Get the rule of the first question found on the title (None if there is none)."""
+
+        search = self.regex.search(title.lower())
+        if search is None:
+            return None
+        return self.rules[int(search.lastgroup[4:])]
+
+def build_queries(rules, max_length=512):
+    """Merge the search queries of the rules with OR, into as few queries as
+    possible within the maximum length of a Reddit search query."""
+
+    queries = []
+    current = ""
+    for rule in rules:
+        query = rule.query
+        if current and len(current) + len(" OR ") + len(query) <= max_length:
+            current = f"{current} OR {query}"
+        else:
+            if current:
+                queries.append(current)
+            current = query
+    if current:
+        queries.append(current)
+    return queries
@@ -0,0 +1,100 @@
+from collections import deque
+from chickenclock import time
+
+class PollScheduler():
+    """Decides how long the bot waits between searches, based on how often the
+    question has been showing up.
+
+    The scheduler keeps the creation times of the posts found over the last days
+    ('history' seconds). The expected amount of posts per second is estimated from
+    them in two ways, and the highest value is used:
+        - the rate at the current hour of the day, averaged over the past days
+        - the rate over the recent period ('recent' seconds), so clustered posts are noticed
+
+    Then the wait time is set so that, on average, 'target_hits' posts are found per
+    search, limited between 'min_interval' and 'max_interval'. Before there is any
+    data, the wait is 'base_interval'.
+
+    The wait is also extended until the rate limit resets when there are less than
+    'reserve' API requests left on the current rate limit window.
+    """
+
+    def __init__(self,
+        base_interval = 3600,   # Wait time in seconds when there is no data yet
+        min_interval = 600,     # Shortest allowed wait (busy periods)
+        max_interval = 7200,    # Longest allowed wait (quiet periods)
+        target_hits = 1.0,      # Average amount of posts to be found per search
+        history = 14 * 86400,   # For how long the post times are kept
+        recent = 7200,          # Time window for detecting clustered posts
+        reserve = 10,           # Minimum amount of API requests to keep on the rate limit
+    ):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_hits = target_hits
+        self.history = history
+        self.recent = recent
+        self.reserve = reserve
+        self.arrivals = deque()     # Creation times of the found posts (oldest first)
+
+    def record_hits(self, created_times):
+        """Add the creation times (Unix epoch) of newly found posts."""
+
+        self.arrivals.extend(sorted(created_times))
+        self.prune(time())
+
+    def prune(self, now):
+        """Remove the post times that are older than the history period."""
+
+        while self.arrivals and (now - self.arrivals[0] > self.history):
+            self.arrivals.popleft()
+
+    def hit_rate(self, now):
+        """Expected amount of posts per second at this moment."""
+
+        if not self.arrivals:
+            return None
+
+        # Rate of the recent period
+        recent_hits = sum(1 for created in self.arrivals if now - created <= self.recent)
+        recent_rate = recent_hits / self.recent
+
+        # Rate of the current hour of the day (and its two neighbors), averaged over the observed days
+        observed = min(now - self.arrivals[0], self.history)
+        days = max(observed / 86400, 1.0)
+        hour = int(now // 3600) % 24
+        neighbors = {(hour - 1) % 24, hour, (hour + 1) % 24}
+        hour_hits = sum(1 for created in self.arrivals if int(created // 3600) % 24 in neighbors)
+        hour_rate = hour_hits / (days * 3 * 3600)
+
+        return max(recent_rate, hour_rate)
+
+    def next_interval(self, limits=None):
+        """Wait time in seconds until the next search."""
+
+        now = time()
+        self.prune(now)
+        rate = self.hit_rate(now)
+
+        if rate is None:
+            interval = self.base_interval
+        elif rate == 0:
+            interval = self.max_interval
+        else:
+            interval = min(max(self.target_hits / rate, self.min_interval), self.max_interval)
+
+        return self.respect_limits(interval, limits)
+
+    def respect_limits(self, interval, limits=None):
+        """Extend the wait time until the rate limit resets, if the remaining requests are too few.
+        'limits' is the dictionary returned by PRAW's 'reddit.auth.limits'."""
+
+        if not limits:
+            return interval
+
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        if (remaining is None) or (reset_timestamp is None) or (remaining >= self.reserve):
+            return interval
+
+        return max(interval, reset_timestamp - time())
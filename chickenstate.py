@@ -0,0 +1,285 @@
+import sqlite3
+import json
+from pathlib import Path
+from threading import Lock
+from chickenclock import time
+
+class StateStore():
+    """Persistent storage of the bot's state, so it can resume from where it stopped
+    without rebuilding everything from the Reddit API.
+
+    The state is kept on a SQLite database in WAL mode (writes are journaled, so a
+    crash does not corrupt the stored data). There are five tables:
+        - 'state': general key/value pairs (values are stored as JSON)
+        - 'replied_users': the users who got a reply, the time of the reply, and when their cooldown expires
+        - 'reply_stats': amount of replies per day and subreddit
+        - 'bot_replies': fullnames of the bot's comments, by the fullname of the post they replied to
+        - 'claims': posts that a bot process has taken for replying, and the post's author
+    
+    Several bot processes can share the same database. The write transactions take
+    the database's write lock from the start (BEGIN IMMEDIATE), so the changes that
+    depend on the stored values (the claims, the counter, the responses cursor) are
+    atomic between the processes.
+    
+    The reply counter and statistics are updated on each reply, and the signature of
+    the replies log (see 'chickenlog.log_signature()') is stored each time the log is
+    written. So on startup the bot can tell whether they are in sync with the log
+    just by comparing the signatures.
+
+    The reply being made is kept as a checkpoint on the key/value table, from before
+    it is posted until it is written to the log. So after a crash, the bot can finish
+    recording it (see 'ChickenBot.recover_reply()').
+    """
+
+    def __init__(self, path="chickenbot_state.db"):
+        self.path = Path(path)
+        self.existed = self.path.exists()   # Whether the database was already there before this session
+
+        # The same connection is shared by the listener threads, so the access is serialized by a lock
+        self.lock = Lock()
+        # (the timeout is how long to wait when another process is writing)
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS replied_users (user_id TEXT PRIMARY KEY, replied_at REAL, expires_at REAL)")
+        
+        # Add the cooldown expiry to the databases of older versions
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(replied_users)")]
+        if "expires_at" not in columns:
+            self.db.execute("ALTER TABLE replied_users ADD COLUMN expires_at REAL")
+        
+        self.db.execute("CREATE TABLE IF NOT EXISTS reply_stats (day TEXT, subreddit TEXT, replies INTEGER, PRIMARY KEY (day, subreddit))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS bot_replies (submission TEXT PRIMARY KEY, comment TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS claims (submission TEXT PRIMARY KEY, user_id TEXT, worker TEXT, claimed_at REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS claims_user ON claims (user_id, claimed_at)")
+
+    def get(self, key, default=None):
+        """Get a value from the key/value table."""
+
+        with self.lock:
+            row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, **values):
+        """Store one or more values on the key/value table, on a single transaction.
+        The time of the update is also stored, so the bot can tell when the state is stale."""
+
+        values["updated_at"] = time()
+        rows = [(key, json.dumps(value)) for key, value in values.items()]
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", rows)
+
+    def update(self, key, function):
+        """Replace a value of the key/value table by the result of 'function(old_value)',
+        on a single transaction (so no other process changes the value meanwhile).
+        'old_value' is None if the key is not stored. Returns the new value."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            value = function(None if row is None else json.loads(row[0]))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)), ("updated_at", json.dumps(time()))]
+            )
+        return value
+
+    def age(self):
+        """How many seconds have passed since the state was last updated."""
+
+        return time() - self.get("updated_at", 0.0)
+
+    def replied_users(self, cooldown):
+        """Dictionary of the stored users and the Unix time when their cooldown expires.
+        'cooldown' (in seconds) is used for the users stored without an expiry time."""
+
+        with self.lock:
+            rows = self.db.execute("SELECT user_id, replied_at, expires_at FROM replied_users").fetchall()
+        return {
+            user: expires_at if expires_at is not None else replied_at + cooldown
+            for user, replied_at, expires_at in rows
+        }
+
+    def add_replied_users(self, users):
+        """Store a dictionary of users and a tuple of: Unix time of the reply, Unix time when the cooldown expires."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO replied_users (user_id, replied_at, expires_at) VALUES (?, ?, ?)",
+                ((user, replied_at, expires_at) for user, (replied_at, expires_at) in users.items())
+            )
+
+    def remove_replied_users(self, users):
+        """Remove an iterable of users from storage."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany("DELETE FROM replied_users WHERE user_id = ?", ((user,) for user in users))
+
+    def prune_replied_users(self, cooldown):
+        """Remove the users whose cooldown has expired (including those who expired while the bot was stopped).
+        'cooldown' (in seconds) is used for the users stored without an expiry time."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute(
+                "DELETE FROM replied_users WHERE COALESCE(expires_at, replied_at + ?) <= ?",
+                (cooldown, time())
+            )
+
+    def add_bot_replies(self, replies):
+        """Store a dictionary of post fullnames and the fullnames of the bot's comments on them."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany("INSERT OR REPLACE INTO bot_replies (submission, comment) VALUES (?, ?)", replies.items())
+
+    def bot_replies(self, submissions):
+        """Get the bot's comments on a list of posts (fullnames).
+        Returns a dictionary of the post fullnames and the comment fullnames that were found."""
+
+        submissions = list(submissions)
+        replies = dict()
+        with self.lock:
+            for start in range(0, len(submissions), 500):  # (SQLite has a limit of parameters per query)
+                chunk = submissions[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                replies.update(self.db.execute(f"SELECT submission, comment FROM bot_replies WHERE submission IN ({marks})", chunk).fetchall())
+        return replies
+
+    def claim(self, submission, user_id, worker, cooldown):
+        """Take a post for replying. Returns whether the post was claimed.
+
+        The claim fails if the post was already claimed, or if its author is on
+        cooldown, or if another post of the author was claimed less than 'cooldown'
+        seconds ago (so two processes do not reply to the same author)."""
+
+        now = time()
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            if self.db.execute("SELECT 1 FROM claims WHERE submission = ?", (submission,)).fetchone():
+                return False
+            if user_id is not None:
+                if self.db.execute("SELECT 1 FROM replied_users WHERE user_id = ? AND expires_at > ?", (user_id, now)).fetchone():
+                    return False
+                if self.db.execute("SELECT 1 FROM claims WHERE user_id = ? AND claimed_at > ?", (user_id, now - cooldown)).fetchone():
+                    return False
+            self.db.execute(
+                "INSERT INTO claims (submission, user_id, worker, claimed_at) VALUES (?, ?, ?, ?)",
+                (submission, user_id, worker, now)
+            )
+        return True
+
+    def release_author(self, submission):
+        """Let the author of a claimed post be claimed again (when the reply to the post has failed).
+        The post itself stays claimed."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("UPDATE claims SET user_id = NULL WHERE submission = ?", (submission,))
+
+    def prune_claims(self, max_age):
+        """Remove the claims older than 'max_age' seconds."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("DELETE FROM claims WHERE claimed_at < ?", (time() - max_age,))
+
+    def complete_reply(self, checkpoint_key, checkpoint, day, replied_at, expires_at):
+        """Record a posted reply on a single transaction: the reply counter and statistics,
+        the author's cooldown (until 'expires_at'), the bot's comment on the post, and the
+        reply's checkpoint with its counter (stored under 'checkpoint_key').
+        So a crash never leaves the reply half recorded. Returns the updated reply counter."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute("SELECT value FROM state WHERE key = 'reply_counter'").fetchone()
+            counter = (0 if row is None else json.loads(row[0])) + 1
+            self.db.execute(
+                "INSERT INTO reply_stats (day, subreddit, replies) VALUES (?, ?, 1) "
+                "ON CONFLICT (day, subreddit) DO UPDATE SET replies = replies + 1",
+                (day, checkpoint["subreddit"])
+            )
+            if checkpoint["user_id"] is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO replied_users (user_id, replied_at, expires_at) VALUES (?, ?, ?)",
+                    (checkpoint["user_id"], replied_at, expires_at)
+                )
+            self.db.execute(
+                "INSERT OR REPLACE INTO bot_replies (submission, comment) VALUES (?, ?)",
+                (checkpoint["post_name"], checkpoint["comment_name"])
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                [
+                    ("reply_counter", json.dumps(counter)),
+                    (checkpoint_key, json.dumps({**checkpoint, "counter": counter})),
+                    ("updated_at", json.dumps(time())),
+                ]
+            )
+        return counter
+
+    def record_log_signature(self, log_path, signature, checkpoint_key=None, logged=()):
+        """Store the signature of a replies log, after records were written to it.
+
+        On the same transaction, the reply checkpoint stored under 'checkpoint_key' is
+        cleared if its comment is among 'logged' (the comments of the replies written)."""
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = dict(self.db.execute("SELECT key, value FROM state WHERE key IN (?, ?)", ("log_signatures", checkpoint_key)).fetchall())
+            signatures = json.loads(rows.get("log_signatures", "{}"))
+            signatures[str(log_path)] = signature
+            values = [("log_signatures", json.dumps(signatures)), ("updated_at", json.dumps(time()))]
+
+            checkpoint = json.loads(rows.get(checkpoint_key, "null"))
+            if (checkpoint is not None) and (checkpoint.get("comment") in logged):
+                values.append((checkpoint_key, json.dumps(None)))
+            self.db.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", values)
+
+    def reply_stats(self):
+        """List of (day, subreddit, replies) tuples, sorted by day."""
+
+        with self.lock:
+            return self.db.execute("SELECT day, subreddit, replies FROM reply_stats ORDER BY day, subreddit").fetchall()
+
+    def counter_in_sync(self, signatures):
+        """Whether the stored reply counter matches the current contents of the replies logs.
+        'signatures' is a dictionary of the paths of the logs and their current signatures."""
+
+        saved = self.get("log_signatures", dict())
+        return (self.get("reply_counter") is not None) and all(
+            saved.get(str(path)) == signature for path, signature in signatures.items()
+        )
+
+    def rebuild_reply_stats(self, replies, counter_start=0, signatures=dict()):
+        """Recompute the reply counter and statistics from the replies on the logs.
+        'replies' is an iterable of the (day, subreddit) of each reply (see 'chickenlog.read_replies()'),
+        and 'signatures' are the signatures of the logs that were read.
+        Returns the recomputed counter."""
+
+        counter = counter_start
+        stats = dict()
+        for key in replies:
+            counter += 1
+            stats[key] = stats.get(key, 0) + 1
+
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("DELETE FROM reply_stats")
+            self.db.executemany(
+                "INSERT INTO reply_stats (day, subreddit, replies) VALUES (?, ?, ?)",
+                ((day, subreddit, replies) for (day, subreddit), replies in stats.items())
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                [("reply_counter", json.dumps(counter)), ("log_signatures", json.dumps({str(path): signature for path, signature in signatures.items()}))]
+            )
+        return counter
+
+    def close(self):
+        with self.lock:
+            self.db.close()
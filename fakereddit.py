@@ -0,0 +1,392 @@
+"""Offline stand-in for the Reddit API, for testing and benchmarking the bot without
+touching the live Reddit.
+
+It is a small HTTP server running on localhost, which implements only the endpoints
+that the bot uses. PRAW is pointed to it through the 'oauth_url' and 'reddit_url'
+settings (see 'FakeReddit.reddit()'). The server counts the requests and the bytes
+sent and received, so the API cost of each bot operation can be measured."""
+
+import json
+import praw
+import re
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Thread, RLock
+from time import time
+from urllib.parse import urlsplit, parse_qs
+
+class FakeReddit():
+    """In-memory Reddit served over HTTP on localhost.
+
+    The data is kept in dictionaries of the raw JSON objects, the same way Reddit
+    returns them on its listings:
+        - 'submissions' and 'comments': keyed by their base36 ID
+        - 'users' and 'subreddits': keyed by their name
+        - 'messages': list of the items of the bot's inbox (private messages, and replies to the bot's comments)
+    Replies to posts on subreddits in 'forbidden' fail with HTTP 403, replies to the posts
+    marked as 'locked' fail with a THREAD_LOCKED error, and the requests
+    to an endpoint can be made to fail with a server error (see 'fail()').
+    """
+
+    def __init__(self, bot_name="ChickenRoad_Bot"):
+        self.bot_name = bot_name
+        self.submissions = dict()
+        self.comments = dict()
+        self.users = dict()
+        self.subreddits = dict()
+        self.messages = list()
+        self.forbidden = set()
+        self.failures = Counter()   # Amount of the next requests to each endpoint that fail with HTTP 503
+        self.lock = RLock()
+        self.next_id = 1000000
+        self.add_user(bot_name)
+        self.reset_counters()
+
+        # Start the server on a free port
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRedditHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reddit(self, **settings):
+        """PRAW instance connected to this fake server (with optional extra settings)."""
+
+        return praw.Reddit(
+            client_id = "fake_id",
+            client_secret = "fake_secret",
+            username = self.bot_name,
+            password = "fake_password",
+            user_agent = "ChickenBot offline tests",
+            oauth_url = self.url,
+            reddit_url = self.url,
+            short_url = self.url,
+            check_for_updates = False,
+            **settings,
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        """Set to zero the amount of requests and bytes."""
+
+        self.requests = 0
+        self.bytes_sent = 0         # Sent by the client (bot) to the server
+        self.bytes_received = 0     # Received by the client (bot) from the server
+        self.endpoints = Counter()  # Amount of requests per endpoint
+
+    def fail(self, endpoint, times=1):
+        """Make the next requests to an endpoint (e.g. "GET /api/info") fail with HTTP 503.
+        (PRAW retries a server error by itself a couple of times before raising it)"""
+
+        with self.lock:
+            self.failures[endpoint] += times
+
+    def new_id(self):
+        """Get a new unique base36 ID."""
+
+        with self.lock:
+            self.next_id += 1
+            number = self.next_id
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+        base36 = ""
+        while number:
+            number, digit = divmod(number, 36)
+            base36 = digits[digit] + base36
+        return base36
+
+    # Seeding the data
+
+    def add_user(self, name):
+        if name not in self.users:
+            self.users[name] = {"name": name, "id": self.new_id(), "created_utc": 0.0}
+        return self.users[name]
+
+    def add_subreddit(self, name, forbidden=False):
+        if name not in self.subreddits:
+            sub_id = self.new_id()
+            self.subreddits[name] = {"display_name": name, "id": sub_id, "name": f"t5_{sub_id}"}
+        if forbidden:
+            self.forbidden.add(name)
+        return self.subreddits[name]
+
+    def add_submission(self, title, author, subreddit, created_utc):
+        """Add a post ('author' is None for a post whose author was deleted)."""
+
+        user = self.add_user(author) if author is not None else None
+        sub = self.add_subreddit(subreddit)
+        post_id = self.new_id()
+        post = {
+            "id": post_id, "name": f"t3_{post_id}", "title": title, "selftext": "",
+            "author": "[deleted]",
+            "subreddit": sub["display_name"], "subreddit_id": sub["name"],
+            "created_utc": created_utc, "num_comments": 0, "url": "", "locked": False,
+            "permalink": f"/r/{sub['display_name']}/comments/{post_id}/fake_post/",
+        }
+        if user is not None:
+            post.update({"author": user["name"], "author_fullname": f"t2_{user['id']}"})
+        self.submissions[post_id] = post
+        return post
+
+    def add_comment(self, post_id, author, body, created_utc):
+        user = self.add_user(author)
+        post = self.submissions[post_id]
+        comment_id = self.new_id()
+        comment = {
+            "id": comment_id, "name": f"t1_{comment_id}", "body": body,
+            "author": user["name"], "author_fullname": f"t2_{user['id']}",
+            "link_id": post["name"], "parent_id": post["name"],
+            "subreddit": post["subreddit"], "subreddit_id": post["subreddit_id"],
+            "created_utc": created_utc, "replies": "",
+            "permalink": f"{post['permalink']}{comment_id}/",
+        }
+        self.comments[comment_id] = comment
+        return comment
+
+    def add_message(self, author, subject, body, new=True):
+        user = self.add_user(author)
+        message_id = self.new_id()
+        message = {
+            "id": message_id, "name": f"t4_{message_id}", "subject": subject, "body": body,
+            "author": user["name"], "author_fullname": f"t2_{user['id']}", "dest": self.bot_name,
+            "created_utc": time(), "new": new, "was_comment": False, "replies": "",
+            "first_message": None, "first_message_name": None, "subreddit": None, "parent_id": None,
+        }
+        self.messages.append(message)
+        return message
+
+    def add_comment_reply(self, comment, author, body):
+        """Reply from an user to a comment of the bot, which also goes to the bot's inbox."""
+
+        reply = self.add_comment(comment["link_id"][3:], author, body, time())
+        reply["parent_id"] = comment["name"]
+        item = {**reply, "new": True, "was_comment": True, "type": "comment_reply", "dest": self.bot_name, "context": f"{reply['permalink']}?context=3"}
+        self.messages.append(item)
+        return item
+
+    def seed(self, posts=300, history=50, messages=20, forbidden_subs=3, seed=0, replies=30):
+        """Fill the fake Reddit with synthetic data:
+            - 'posts' submissions asking the question (some on forbidden subreddits, some not asking it exactly,
+              and some whose author was deleted),
+            - 'history' past replies of the bot,
+            - 'messages' unread removal requests on the bot's inbox (from the posters, and from others),
+            - 'replies' unread replies to the bot's comments, which are also on the inbox.
+        """
+
+        rng = Random(seed)
+        now = time()
+        subs = [f"sub{number}" for number in range(20)]
+        for number in range(forbidden_subs):
+            self.add_subreddit(f"banned{number}", forbidden=True)
+            subs.append(f"banned{number}")
+        titles = ["Why did the chicken cross the road?", "why did the chicken cross the road", "Why did the chicken really cross the road?"]
+
+        for number in range(posts):
+            created = now - (posts - number) * 300
+            title, author, sub = rng.choice(titles), f"user{rng.randrange(posts // 2)}", rng.choice(subs)
+            if number % 20 == 0:
+                author = None
+            self.add_submission(title, author, sub, created)
+
+        replied_posts = rng.sample(list(self.submissions), min(history, len(self.submissions)))
+        for post_id in replied_posts:
+            self.add_comment(post_id, self.bot_name, ">Why did the chicken cross the road?\n\nTo bench the road.", self.submissions[post_id]["created_utc"] + 60)
+
+        bot_comments = [comment for comment in self.comments.values() if comment["author"] == self.bot_name]
+        for number in range(messages):
+            comment = rng.choice(bot_comments)
+            post = self.submissions[comment["link_id"][3:]]
+            author = post["author"] if (number % 2 == 0) and (post["author"] != "[deleted]") else f"stranger{number}"
+            if number % 3 == 0:     # Requests that refer to the post
+                request = f"Please remove the reply to /r/{post['subreddit']}/comments/{post['id']}/"
+            else:                   # Requests that refer to the comment (some comments don't exist)
+                link = comment["permalink"] if number % 5 else f"{post['permalink']}zzzzzz/"
+                request = f"Please remove {link}"
+            self.add_message(author, "Removal of ChickenBot's comment", f"{request}\n\n[do not edit the first line]")
+
+        for number in range(replies):
+            self.add_comment_reply(rng.choice(bot_comments), f"replier{number}", "Good bot")
+
+    def comments_on(self, fullname):
+        """Comments on a post (by the post's fullname)."""
+
+        return [comment for comment in self.comments.values() if comment["link_id"] == fullname]
+
+    # Building the responses
+
+    def listing(self, kind, items, params):
+        """Build a listing with the paging parameters ('limit', 'after', 'before')."""
+
+        limit = int(params.get("limit", 25) or 25)
+        kinds = kind if callable(kind) else (lambda item: kind)
+        names = [item["name"] for item in items]
+        start = 0
+        if params.get("after") in names:
+            start = names.index(params["after"]) + 1
+        elif params.get("before") in names:
+            end = names.index(params["before"])
+            start = max(end - limit, 0)
+            items = items[:end]
+        page = items[start:start + limit]
+        after = page[-1]["name"] if (start + limit < len(items)) and page else None
+        return {"kind": "Listing", "data": {
+            "after": after, "before": None, "dist": len(page),
+            "children": [{"kind": kinds(item), "data": item} for item in page],
+        }}
+
+    def thing(self, fullname):
+        """Get a raw object and its kind from its fullname."""
+
+        kind, _, item_id = fullname.partition("_")
+        if kind == "t5":
+            item = next((sub for sub in self.subreddits.values() if sub["id"] == item_id), None)
+            return (kind, item) if item is not None else (None, None)
+        source = {"t1": self.comments, "t3": self.submissions}.get(kind, {})
+        item = source.get(item_id)
+        return (kind, item) if item is not None else (None, None)
+
+    def new_comment(self, fullname, text):
+        """Post a bot comment. Returns the status and JSON of the response."""
+
+        kind, parent = self.thing(fullname)
+        if parent is None:
+            return 400, {"json": {"errors": [["NOT_FOUND", "not found", "thing_id"]]}}
+        if parent["subreddit"] in self.forbidden:
+            return 403, {"message": "Forbidden", "error": 403}
+        post_id = parent["id"] if kind == "t3" else parent["link_id"][3:]
+        if self.submissions[post_id]["locked"]:
+            return 200, {"json": {"errors": [["THREAD_LOCKED", "Comments are locked.", "parent"]]}}
+        comment = self.add_comment(post_id, self.bot_name, text, time())
+        return 200, {"json": {"errors": [], "data": {"things": [{"kind": "t1", "data": comment}]}}}
+
+    def handle(self, method, path, params):
+        """Route a request. Returns the status and JSON of the response."""
+
+        user = path.split("/")[2] if path.startswith("/user/") else None
+        bot = self.users[self.bot_name]
+
+        if path == "/api/v1/access_token":
+            return 200, {"access_token": "fake_token", "token_type": "bearer", "expires_in": 86400, "scope": "*"}
+        if path == "/api/v1/me":
+            return 200, bot
+        if path.startswith("/user/") and path.endswith("/about"):
+            if user not in self.users:
+                return 404, {"message": "Not Found", "error": 404}
+            return 200, {"kind": "t2", "data": self.users[user]}
+        if path.startswith("/user/") and path.endswith("/comments"):
+            items = sorted((comment for comment in self.comments.values() if comment["author"] == user), key=lambda item: -item["created_utc"])
+            return 200, self.listing("t1", items, params)
+        if path.startswith("/r/") and path.endswith("/about"):
+            sub = self.subreddits.get(path.split("/")[2])
+            if sub is None:
+                return 404, {"message": "Not Found", "error": 404}
+            return 200, {"kind": "t5", "data": sub}
+        if path.startswith("/r/") and path.endswith("/search"):
+            query = params.get("q", "").lower()
+            excluded = set(re.findall(r"not subreddit:(\w+)", query))
+            words = re.sub(r"not subreddit:\w+", "", query).replace("(", "").replace(")", "").replace('"', "").replace("title:", "")
+            words = [word for word in words.split() if word not in ("or", "and")]
+            items = [
+                post for post in self.submissions.values()
+                if all(word in post["title"].lower() for word in words) and post["subreddit"].lower() not in excluded
+            ]
+            items.sort(key=lambda item: -item["created_utc"])
+            return 200, self.listing("t3", items, params)
+        if path.startswith("/r/") and path.endswith("/new"):
+            names = set(path.split("/")[2].lower().split("+"))
+            items = [post for post in self.submissions.values() if post["subreddit"].lower() in names or "all" in names]
+            items.sort(key=lambda item: -item["created_utc"])
+            return 200, self.listing("t3", items, params)
+        if path.startswith("/comments/"):
+            post = self.submissions.get(path.split("/")[2])
+            if post is None:
+                return 404, {"message": "Not Found", "error": 404}
+            comments = [comment for comment in self.comments.values() if comment["link_id"] == post["name"]]
+            return 200, [self.listing("t3", [post], {}), self.listing("t1", comments, {"limit": 100})]
+        if path == "/api/info":
+            items = [self.thing(fullname) for fullname in params.get("id", "").split(",") if fullname]
+            items += [("t5", self.subreddits.get(name)) for name in params.get("sr_name", "").split(",") if name]
+            return 200, {"kind": "Listing", "data": {"after": None, "before": None, "children": [
+                {"kind": kind, "data": item} for kind, item in items if item is not None
+            ]}}
+        if path in ("/message/messages", "/message/inbox", "/message/unread"):
+            items = self.messages[::-1]
+            if path == "/message/messages":
+                items = [message for message in items if not message["was_comment"]]
+            if path == "/message/unread":
+                items = [message for message in items if message["new"]]
+            return 200, self.listing(lambda item: "t1" if item["was_comment"] else "t4", items, params)
+        if path == "/api/read_message":
+            names = set(params.get("id", "").split(","))
+            for message in self.messages:
+                if message["name"] in names:
+                    message["new"] = False
+            return 200, {}
+        if path == "/api/comment":
+            return self.new_comment(params.get("thing_id", ""), params.get("text", ""))
+        if path == "/api/editusertext":
+            kind, comment = self.thing(params.get("thing_id", ""))
+            if comment is None:
+                return 400, {"json": {"errors": [["NOT_FOUND", "not found", "thing_id"]]}}
+            comment["body"] = params.get("text", "")
+            return 200, {"json": {"errors": [], "data": {"things": [{"kind": "t1", "data": comment}]}}}
+        if path == "/api/del":
+            kind, comment = self.thing(params.get("id", ""))
+            if comment is not None:
+                comment["author"] = "[deleted]"
+                comment["body"] = "[deleted]"
+                comment.pop("author_fullname", None)
+            return 200, {}
+        if path == "/api/compose":
+            return 200, {"json": {"errors": []}}
+
+        return 404, {"message": "Not Found", "error": 404}
+
+class FakeRedditHandler(BaseHTTPRequestHandler):
+    """Handler of the HTTP requests to the fake Reddit."""
+
+    def respond(self, method):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path.endswith(".json"):
+            path = path[:-5]
+
+        # Query string and form parameters
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        body = self.rfile.read(length) if length else b""
+        params.update({key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()})
+
+        with fake.lock:
+            if fake.failures[f"{method} {path}"] > 0:
+                fake.failures[f"{method} {path}"] -= 1
+                status, data = 503, {"message": "Service Unavailable", "error": 503}
+            else:
+                status, data = fake.handle(method, path, params)
+            response = json.dumps(data).encode("utf-8")
+            fake.requests += 1
+            fake.endpoints[f"{method} {path}"] += 1
+            fake.bytes_sent += len(self.requestline) + length
+            fake.bytes_received += len(response)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(response)))
+        self.send_header("x-ratelimit-remaining", "995")
+        self.send_header("x-ratelimit-used", "5")
+        self.send_header("x-ratelimit-reset", "300")
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def log_message(self, format, *args):
+        pass    # Do not print each request to the terminal
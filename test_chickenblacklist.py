@@ -0,0 +1,69 @@
+"""Tests of the blacklist of subreddits (see 'chickenblacklist')."""
+
+import unittest
+from pathlib import Path
+from chickenblacklist import Blacklist
+from chickenrules import Rule, build_queries
+from chickenstate import StateStore
+from testsupport import FolderTestCase
+
+class BlacklistTest(FolderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.state = StateStore()
+        Path("blacklist.txt").write_text("listed\nt5_abc\n", encoding="utf-8")
+        # (the lookup of the file's subreddits is already on the state, so Reddit is not needed)
+        self.state.set(subreddit_lookup={"listed": ["t5_listed", "Listed"], "t5_abc": ["t5_abc", "abc"]})
+        self.blacklist = Blacklist(self.state, reddit=None, refusal_limit=2, ttl=100)
+
+    def tearDown(self):
+        self.state.close()
+        super().tearDown()
+
+    def test_file(self):
+        self.assertTrue(self.blacklist.blocks("t5_other", "LISTED"))
+        self.assertTrue(self.blacklist.blocks("t5_abc", "renamed"))
+        self.assertFalse(self.blacklist.blocks("t5_other", "other"))
+
+    def test_learned_subreddit_expires(self):
+        self.assertFalse(self.blacklist.refused("t5_sub", "sub"))
+        self.assertTrue(self.blacklist.refused("t5_sub", "sub"))
+        self.assertTrue(self.blacklist.blocks("t5_sub", "sub"))
+
+        self.clock.sleep(101)
+        self.assertFalse(self.blacklist.blocks("t5_sub", "sub"))
+
+        # After the period, a single refusal blacklists it again
+        self.assertTrue(self.blacklist.refused("t5_sub", "sub"))
+        self.assertTrue(self.blacklist.blocks("t5_sub", "sub"))
+
+    def test_accepted_reply_forgets_the_refusals(self):
+        self.blacklist.refused("t5_sub", "sub")
+        self.blacklist.accepted("t5_sub")
+        self.assertFalse(self.blacklist.refused("t5_sub", "sub"))
+
+    def test_shared_through_the_state(self):
+        self.blacklist.refused("t5_sub", "sub")
+        self.blacklist.refused("t5_sub", "sub")
+        other = Blacklist(self.state, reddit=None, refusal_limit=2, ttl=100)
+        self.assertTrue(other.blocks("t5_sub", "sub"))
+
+    def test_excluded_from_the_queries(self):
+        self.blacklist.refused("t5_sub", "sub")
+        self.blacklist.refused("t5_sub", "sub")
+        query = self.blacklist.exclude_from("(title:question)")
+        self.assertEqual(query, "((title:question)) NOT subreddit:sub NOT subreddit:Listed NOT subreddit:abc")
+        self.assertEqual(self.blacklist.exclude_from("(title:question)", max_length=36), "((title:question)) NOT subreddit:sub")
+        self.assertEqual(self.blacklist.exclude_from("(title:question)", max_length=35), "(title:question)")
+
+    def test_exclusions_cover_every_rule(self):
+        query = build_queries([Rule("chicken", "why did the chicken cross the road"), Rule("duck", "why did the duck cross the road")])[0]
+        self.assertEqual(
+            self.blacklist.exclude_from(query),
+            "((title:why did the chicken cross the road) OR (title:why did the duck cross the road))"
+            " NOT subreddit:Listed NOT subreddit:abc"
+        )
+
+if __name__ == "__main__":
+    unittest.main()
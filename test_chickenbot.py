@@ -0,0 +1,280 @@
+"""Tests of the bot, run offline against the fake Reddit (see 'fakereddit').
+The tests of the bot's parts are on the other 'test_*.py' modules.
+
+Usage:
+    python -m pytest
+    python -m unittest discover -p "test_*.py"
+"""
+
+import chickenbot
+import json
+import unittest
+from pathlib import Path
+from time import time
+from fakereddit import FakeReddit
+from testsupport import BotTestCase
+
+class BotTest(BotTestCase):
+
+    def test_filtering_makes_no_requests(self):
+        results = list(self.bot.subreddit.search(self.bot.queries[0], sort="new", limit=100))
+        self.bot.previous_reply_time = 0
+        self.fake.reset_counters()
+        passed = [self.bot.submission_testing(submission) for submission in results]
+        self.assertEqual(self.fake.requests, 0)
+        self.assertTrue(any(passed))
+        self.assertFalse(all(passed))   # (some authors were deleted)
+
+    def removal_outcome(self):
+        """Requests that deleted a comment or answered a message, and the unread messages left."""
+
+        unread = [message for message in self.fake.messages if message["new"] and not message["was_comment"]]
+        return self.fake.endpoints["POST /api/del"], self.fake.endpoints["POST /api/compose"], len(unread)
+
+    def test_inbox(self):
+        self.fake.reset_counters()
+        self.quietly(self.bot.private_messages)
+        deleted, answered, unread = self.removal_outcome()
+        self.assertGreater(deleted, 0)
+        self.assertGreater(answered, 0)
+        self.assertEqual(unread, 0)
+
+        # Without new messages, the inbox check is a single request (the replies to the comments are not paged through)
+        self.fake.reset_counters()
+        self.quietly(self.bot.private_messages)
+        self.assertEqual(self.fake.requests, 1)
+
+    def test_inbox_survives_a_server_error(self):
+        # The same inbox, without and with a server error while looking up the requested comments
+        self.fake.reset_counters()
+        self.quietly(self.bot.private_messages)
+        expected = self.removal_outcome()
+
+        self.bot.close()
+        self.fake.close()
+        self.fake = FakeReddit()
+        self.fake.seed(posts=100, history=20, messages=10, replies=10)
+        self.bot = self.new_bot()
+        self.fake.fail("GET /api/info", times=3)
+        self.fake.reset_counters()
+        self.quietly(self.bot.private_messages)
+        self.assertEqual(self.metrics.get("chickenbot_retries_total", operation="inbox"), 1)
+        self.assertEqual(self.removal_outcome(), expected)
+
+class SearchTest(BotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for number in range(150):    # (so the results take several pages)
+            self.fake.add_submission("Why did the chicken cross the road?", f"searcher{number}", "sub1", time() - number)
+        self.query = self.bot.queries[0]
+        self.results = list(self.bot.subreddit.search(self.bot.blacklist.exclude_from(self.query), sort="new", limit=None))
+
+    def new_names(self, cursor):
+        """Names of the posts found by the search after the cursor."""
+
+        self.bot.cursors[self.query] = cursor
+        self.fake.reset_counters()
+        return [submission.name for submission in self.bot.new_submissions(self.query)]
+
+    def test_search_stops_at_the_cursor(self):
+        cursor_post = self.results[30]
+        names = self.new_names({"fullname": cursor_post.name, "created_utc": cursor_post.created_utc})
+        self.assertEqual(names, [submission.name for submission in self.results[:30]])
+        self.assertEqual(self.fake.requests, 1)     # (the older pages are not fetched)
+
+    def test_deleted_cursor_post(self):
+        cursor_post = self.results[30]
+        del self.fake.submissions[cursor_post.id]
+        names = self.new_names({"fullname": cursor_post.name, "created_utc": cursor_post.created_utc})
+        self.assertEqual(names, [submission.name for submission in self.results[:30]])
+        self.assertEqual(self.fake.requests, 1)
+
+    def test_first_search_fetches_one_page(self):
+        names = self.new_names({"fullname": "", "created_utc": 0.0})
+        self.assertEqual(names, [submission.name for submission in self.results[:len(names)]])
+        self.assertEqual(self.fake.requests, 1)
+
+    def test_cursor_moves_to_the_newest_post(self):
+        cursor_post = self.results[5]
+        self.bot.cursors[self.query] = {"fullname": cursor_post.name, "created_utc": cursor_post.created_utc}
+        self.quietly(self.bot.check_submissions)
+        saved = self.bot.state.get("search_cursors")[self.query]
+        self.assertEqual(saved, {"fullname": self.results[0].name, "created_utc": self.results[0].created_utc})
+
+class StreamTest(BotTestCase):
+    """The same posts being found by both the search and the stream."""
+
+    def setUp(self):
+        super().setUp()
+        self.bot.stream_subreddits = "sub1"
+        self.quietly(self.bot.check_stream)         # (the stream starts after the existing posts)
+        self.quietly(self.bot.check_submissions)    # (and the search cursors move to the newest posts)
+
+    def scanned(self):
+        return {source: self.metrics.get("chickenbot_posts_scanned_total", source=source) for source in ("search", "stream")}
+
+    def test_post_found_by_the_search_is_skipped_by_the_stream(self):
+        submission = self.new_submission("double_poster")
+        before = self.scanned()
+        self.quietly(self.bot.check_submissions)
+        self.quietly(self.bot.check_stream)
+
+        self.assertEqual(self.scanned()["search"], before["search"] + 1)
+        self.assertEqual(self.scanned()["stream"], before["stream"])
+        self.assertEqual(len(self.fake.comments_on(submission.fullname)), 1)
+
+    def test_post_found_by_the_stream_is_skipped_by_the_search(self):
+        submission = self.new_submission("double_poster")
+        before = self.scanned()
+        self.quietly(self.bot.check_stream)
+        self.quietly(self.bot.check_submissions)
+
+        self.assertEqual(self.scanned()["stream"], before["stream"] + 1)
+        self.assertEqual(self.scanned()["search"], before["search"])
+        self.assertEqual(len(self.fake.comments_on(submission.fullname)), 1)
+
+class ReplyTest(BotTestCase):
+
+    def test_reply(self):
+        submission = self.new_submission("poster")
+        counter = self.bot.reply_counter
+        self.quietly(self.bot.make_reply, submission)
+        self.bot.log.flush()    # (the checkpoint is cleared once the reply is written to the log)
+
+        self.assertEqual(len(self.fake.comments_on(submission.fullname)), 1)
+        self.assertEqual(self.bot.state.get("reply_counter"), counter + 1)
+        self.assertIn(chickenbot.author_id(submission), self.bot.replied_users)
+        self.assertIsNone(self.bot.state.get(self.bot.reply_checkpoint_key))
+
+    def test_refused_reply_releases_the_author(self):
+        submission = self.new_submission("refused_poster", subreddit="banned0")
+        self.assertTrue(self.bot.claim(submission, self.bot.rules[0]))
+        self.quietly(self.bot.make_reply, submission)
+
+        self.assertEqual(self.metrics.get("chickenbot_forbidden_total"), 1)
+        self.assertIsNone(self.bot.state.get(self.bot.reply_checkpoint_key))
+        other = self.new_submission("refused_poster")
+        self.assertTrue(self.bot.claim(other, self.bot.rules[0]))
+
+    def test_removal_link(self):
+        text = self.bot.reply_text(self.new_submission("poster"), self.bot.rules[0])
+        self.assertIn("/message/compose/?to=u%2FChickenRoad_Bot&", text)
+
+    def test_removal_link_without_username_on_the_settings(self):
+        self.bot.reddit.config.username = None      # (e.g. logged in with a refresh token)
+        text = self.bot.reply_text(self.new_submission("poster"), self.bot.rules[0])
+        self.assertIn("/message/compose/?to=u%2FChickenRoad_Bot&", text)
+        self.assertEqual(self.bot.username, "ChickenRoad_Bot")
+
+    def assert_failed_reply_releases_the_author(self, submission):
+        """Make a reply that fails, and check that nothing of it is left behind."""
+
+        self.assertTrue(self.bot.claim(submission, self.bot.rules[0]))
+        counter = self.bot.reply_counter
+        self.quietly(self.bot.make_reply, submission)
+        self.bot.log.flush()
+
+        self.assertEqual(self.bot.reply_counter, counter)
+        self.assertIsNone(self.bot.state.get(self.bot.reply_checkpoint_key))
+        self.assertNotIn(chickenbot.author_id(submission), self.bot.replied_users)
+        records = [record for record in chickenbot.read_records(self.bot.log_file_name) if record["post"] == submission.permalink]
+        self.assertEqual([record["kind"] for record in records], ["failed"])
+        other = self.new_submission(submission.author.name)
+        self.assertTrue(self.bot.claim(other, self.bot.rules[0]))
+
+    def test_locked_thread_releases_the_author(self):
+        submission = self.new_submission("locked_poster")
+        self.fake.submissions[submission.id]["locked"] = True
+        self.assert_failed_reply_releases_the_author(submission)
+        self.assertEqual(self.fake.comments_on(submission.fullname), [])
+
+    def test_broken_footer_releases_the_author(self):
+        self.bot.rules[0].footer = "Reply number {counter}, see {}"
+        submission = self.new_submission("footer_poster")
+        self.assert_failed_reply_releases_the_author(submission)
+
+class RecoveryTest(BotTestCase):
+    """The bot being killed while replying (the 'KeyboardInterrupt' stands for it)."""
+
+    def crash_while_replying(self, submission, posted):
+        """Make a reply that is interrupted while it is posted, after or before Reddit gets it."""
+
+        post_reply = submission.reply
+        def reply(text):
+            if posted:
+                post_reply(text)
+            raise KeyboardInterrupt
+        submission.reply = reply
+        self.assertTrue(self.bot.claim(submission, self.bot.rules[0]))
+        with self.assertRaises(KeyboardInterrupt):
+            self.quietly(self.bot.make_reply, submission)
+        self.bot.close()
+        self.bot = self.new_bot()
+
+    def test_crashed_reply_is_recorded_once(self):
+        submission = self.new_submission("unlucky_poster")
+        counter = self.bot.reply_counter
+        def crash(checkpoint):
+            raise KeyboardInterrupt
+        self.bot.finish_reply = crash
+        with self.assertRaises(KeyboardInterrupt):
+            self.quietly(self.bot.make_reply, submission)
+        self.bot.close()
+
+        self.bot = self.new_bot()
+        self.assertEqual(self.bot.reply_counter, counter + 1)
+        self.assertIsNone(self.bot.state.get(self.bot.reply_checkpoint_key))
+        self.assertIn(chickenbot.author_id(submission), self.bot.replied_users)
+
+    def test_reply_posted_before_the_crash_is_recorded(self):
+        submission = self.new_submission("unlucky_poster")
+        counter = self.bot.reply_counter
+        self.crash_while_replying(submission, posted=True)
+
+        self.assertEqual(len(self.fake.comments_on(submission.fullname)), 1)    # (it is not posted again)
+        self.assertEqual(self.bot.reply_counter, counter + 1)
+        self.assertIn(chickenbot.author_id(submission), self.bot.replied_users)
+        self.assertIsNone(self.bot.state.get(self.bot.reply_checkpoint_key))
+
+    def test_reply_not_posted_releases_the_author(self):
+        submission = self.new_submission("unlucky_poster")
+        counter = self.bot.reply_counter
+        self.crash_while_replying(submission, posted=False)
+
+        self.assertEqual(self.fake.comments_on(submission.fullname), [])
+        self.assertEqual(self.bot.reply_counter, counter)
+        self.assertIsNone(self.bot.state.get(self.bot.reply_checkpoint_key))
+        self.assertTrue(self.bot.claim(self.new_submission("unlucky_poster"), self.bot.rules[0]))
+
+class WatchdogTest(BotTestCase):
+
+    def test_stopped_listener_is_restarted(self):
+        self.assertTrue(self.quietly(self.bot.supervise, "submissions", False))
+        self.assertEqual(self.bot.heartbeats["submissions"]["restarts"], 1)
+        self.assertEqual(self.metrics.get("chickenbot_listener_restarts_total", listener="submissions"), 1)
+
+    def test_stuck_listener_is_reported_once(self):
+        heartbeat = self.bot.heartbeats["submissions"]
+        self.assertFalse(self.quietly(self.bot.supervise, "submissions", True))
+        heartbeat["busy_since"] = time() - self.bot.stuck_timeout - 1
+        for _ in range(3):
+            self.assertFalse(self.quietly(self.bot.supervise, "submissions", True))     # (a stuck check is never run twice)
+        self.assertTrue(heartbeat["stuck"])
+        self.assertEqual(self.metrics.get("chickenbot_listener_stuck_total", listener="submissions"), 1)
+        self.assertEqual(heartbeat["restarts"], 0)
+
+        # The listener goes on by itself once its check returns
+        self.bot.run_check("submissions", lambda: None)
+        self.assertFalse(heartbeat["stuck"])
+
+    def test_heartbeat_file(self):
+        self.bot.heartbeat_file = "heartbeat.json"
+        self.bot.run_check("submissions", lambda: None)
+        self.bot.write_heartbeat()
+        heartbeat = json.loads(Path("heartbeat.json").read_text(encoding="utf-8"))
+        self.assertEqual(set(heartbeat["listeners"]), set(self.bot.heartbeats))
+        self.assertIsNotNone(heartbeat["listeners"]["submissions"]["last_check"])
+
+if __name__ == "__main__":
+    unittest.main()
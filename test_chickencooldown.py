@@ -0,0 +1,68 @@
+"""Tests of the cooldown of the authors who got a reply (see 'chickencooldown'),
+and of how the bot keeps the cooldowns between sessions."""
+
+import unittest
+from time import time
+from chickencooldown import CooldownIndex
+from testsupport import BotTestCase, FolderTestCase
+
+class CooldownIndexTest(FolderTestCase):
+
+    def test_users_leave_on_expiry(self):
+        now = self.clock.time()
+        cooldowns = CooldownIndex()
+        cooldowns.add("early", now + 10)
+        cooldowns.add("late", now + 20)
+
+        self.assertIn("early", cooldowns)
+        self.assertEqual(cooldowns.expire(now + 15), ["early"])
+        self.assertNotIn("early", cooldowns)
+        self.assertIn("late", cooldowns)
+        self.assertEqual(len(cooldowns), 1)
+
+    def test_expired_user_is_not_on_cooldown_before_removal(self):
+        cooldowns = CooldownIndex()
+        cooldowns.add("user", self.clock.time() + 10)
+        self.clock.sleep(11)
+        self.assertNotIn("user", cooldowns)
+
+    def test_new_cooldown_replaces_the_old_one(self):
+        now = self.clock.time()
+        cooldowns = CooldownIndex()
+        cooldowns.add("user", now + 10)
+        cooldowns.add("user", now + 100)
+
+        self.assertEqual(cooldowns.expire(now + 50), [])     # The stale entry is skipped
+        self.assertEqual(cooldowns.expiry("user"), now + 100)
+        self.assertEqual(cooldowns.expire(now + 100), ["user"])
+
+    def test_stale_entries_do_not_grow_the_heap(self):
+        now = self.clock.time()
+        cooldowns = CooldownIndex()
+        for number in range(1000):
+            cooldowns.add("user", now + number)
+        self.assertLessEqual(len(cooldowns.heap), 2 * len(cooldowns) + 16)
+        self.assertEqual(cooldowns.expiry("user"), now + 999)
+
+class SavedCooldownsTest(BotTestCase):
+
+    def test_expired_users_are_removed_on_start(self):
+        now = time()
+        self.bot.state.add_replied_users({
+            "expired": (now - 200000, now - 100),
+            "waiting": (now - 100, now + 86300),
+        })
+        self.bot.state.db.execute(  # (saved by an older version, without the expiry time)
+            "INSERT INTO replied_users (user_id, replied_at, expires_at) VALUES ('old', ?, NULL)", (now - 200000,)
+        )
+        self.bot.close()
+
+        self.bot = self.new_bot()
+        saved = self.bot.state.replied_users(self.bot.user_cooldown)
+        self.assertNotIn("expired", saved)
+        self.assertNotIn("old", saved)
+        self.assertIn("waiting", saved)
+        self.assertIn("waiting", self.bot.replied_users)
+
+if __name__ == "__main__":
+    unittest.main()
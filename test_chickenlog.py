@@ -0,0 +1,104 @@
+"""Tests of the bot's structured logs, their rotation and their reading (see 'chickenlog')."""
+
+import gzip
+import json
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from chickenlog import EventLog, log_signature, read_records, read_replies, rotated_files
+from testsupport import FolderTestCase
+
+class EventLogTest(FolderTestCase):
+
+    def new_log(self, **settings):
+        log = EventLog("test_log.jsonl", **settings)
+        self.addCleanup(log.close)
+        return log
+
+    def write(self, log, numbers):
+        """Write each record on its own batch."""
+
+        for number in numbers:
+            log.write("reply", number=number)
+            log.flush()
+
+    def numbers(self, path="test_log.jsonl"):
+        return [record["number"] for record in read_records(path)]
+
+    def test_rotation_by_size(self):
+        log = self.new_log(max_bytes=1)
+        self.write(log, range(5))
+
+        rotated = rotated_files("test_log.jsonl")
+        self.assertEqual(len(rotated), 4)
+        with gzip.open(rotated[0], "rt", encoding="utf-8") as log_file:
+            self.assertEqual(json.loads(log_file.read())["number"], 0)
+        self.assertEqual(self.numbers(), list(range(5)))    # (from the oldest, across the rotated files)
+
+    def test_rotation_by_age(self):
+        log = self.new_log(max_age=3600)
+        self.write(log, range(2))
+        self.clock.sleep(3600)
+        self.write(log, range(2, 4))
+
+        self.assertEqual(len(rotated_files("test_log.jsonl")), 1)
+        self.assertEqual([record["number"] for record in read_records(rotated_files("test_log.jsonl")[0])], [0, 1])
+        self.assertEqual(self.numbers(), list(range(4)))
+
+    def test_backups(self):
+        log = self.new_log(max_bytes=1, backups=2)
+        self.write(log, range(5))
+        self.assertEqual(len(rotated_files("test_log.jsonl")), 2)
+        self.assertEqual(self.numbers(), [2, 3, 4])
+
+    def test_read_records(self):
+        log = self.new_log()
+        log.write("reply", number=0)
+        log.write("error", number=1)
+        log.flush()
+        with open("test_log.jsonl", "a", encoding="utf-8") as log_file:
+            log_file.write('{"time": "2024-01-31 12:0')     # (cut by a crash)
+
+        self.assertEqual([record["number"] for record in read_records("test_log.jsonl", kind="error")], [1])
+        self.assertEqual(self.numbers(), [0, 1])
+        self.assertEqual(list(read_records("missing_log.jsonl")), [])
+
+    def test_on_flush(self):
+        flushed = []
+        log = self.new_log(on_flush=lambda signature, records: flushed.append((signature, records)))
+        log.write("reply", number=0)
+        log.write("reply", number=1)
+        log.flush()
+
+        self.assertEqual(len(flushed), 1)
+        signature, records = flushed[0]
+        self.assertEqual(signature, log_signature("test_log.jsonl"))
+        self.assertEqual([record["number"] for record in records], [0, 1])
+
+    def test_failed_on_flush_keeps_the_log_going(self):
+        def on_flush(signature, records):
+            raise RuntimeError("database is locked")
+        log = self.new_log(on_flush=on_flush)
+        with redirect_stdout(StringIO()):
+            self.write(log, range(2))
+        self.assertEqual(self.numbers(), [0, 1])
+
+    def test_read_replies(self):
+        Path("chickenbot_log.txt").write_text(
+            "2020-01-01 10:00:00\tsomeone\thttps://reddit.com/r/old/comments/a/b/c/\n\n",
+            encoding="utf-8"
+        )
+        log = self.new_log(max_bytes=1)
+        log.write("reply", subreddit="sub1")
+        log.flush()
+        log.write("forbidden", subreddit="sub2")
+        log.write("reply", subreddit="sub3")
+        log.flush()
+
+        replies = list(read_replies(["test_log.jsonl"]))   # (the legacy replies first, then the rotated files)
+        self.assertEqual(replies[0], ("2020-01-01", "old"))
+        self.assertEqual([subreddit for day, subreddit in replies], ["old", "sub1", "sub3"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Tests of the metrics of the bot's operation (see 'chickenmetrics')."""
+
+import unittest
+from pathlib import Path
+from threading import Thread
+from chickenmetrics import Metrics
+from testsupport import BotTestCase, FolderTestCase
+
+class MetricsTest(FolderTestCase):
+
+    def test_render(self):
+        metrics = Metrics()
+        metrics.describe("chickenbot_replies_total", "Replies posted")
+        metrics.count("chickenbot_replies_total")
+        metrics.count("chickenbot_posts_filtered_total", 2, reason="cooldown")
+        metrics.observe("chickenbot_reply_seconds", 0.5)
+        metrics.observe("chickenbot_reply_seconds", 1.5)
+
+        text = metrics.render()
+        self.assertIn("# HELP chickenbot_replies_total Replies posted", text)
+        self.assertIn("chickenbot_replies_total 1", text)
+        self.assertIn('chickenbot_posts_filtered_total{reason="cooldown"} 2', text)
+        self.assertIn("chickenbot_reply_seconds_count 2", text)
+        self.assertIn("chickenbot_reply_seconds_sum 2.0", text)
+        self.assertIn("chickenbot_reply_seconds_max 1.5", text)
+
+    def test_concurrent_writes(self):
+        metrics = Metrics()
+        errors = []
+        def write():
+            for number in range(200):
+                metrics.count("chickenbot_checks_total")
+                try:
+                    metrics.write("metrics.prom")
+                except OSError as error:
+                    errors.append(error)
+        threads = [Thread(target=write) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([path.name for path in Path().iterdir()], ["metrics.prom"])   # (no temporary files left)
+        self.assertIn("chickenbot_checks_total", Path("metrics.prom").read_text(encoding="utf-8"))
+
+class MetricsFileTest(BotTestCase):
+
+    def test_write_error_does_not_stop_the_listener(self):
+        self.bot.metrics_file = "missing_folder/metrics.prom"
+        self.quietly(self.bot.write_metrics)
+        self.assertEqual(self.metrics.get("chickenbot_errors_total", type="FileNotFoundError"), 1)
+
+if __name__ == "__main__":
+    unittest.main()
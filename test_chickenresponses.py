@@ -0,0 +1,135 @@
+"""Tests of the pools of responses (see 'chickenresponses'), and of the import of the
+responses queue saved by older versions of the bot."""
+
+import pickle
+import unittest
+from collections import deque
+from os import utime
+from pathlib import Path
+from chickenresponses import ResponsePool
+from chickenstate import StateStore
+from testsupport import BotTestCase, FolderTestCase
+
+class ResponsePoolTest(FolderTestCase):
+
+    def write_responses(self, responses):
+        path = Path("responses.txt")
+        path.write_text("".join(f"{response}\n" for response in responses), encoding="utf-8")
+        # (the index is rebuilt on a change of size or modification time, so make sure one of them changes)
+        self.version = getattr(self, "version", 0) + 1
+        utime(path, ns=(self.version * 10**9, self.version * 10**9))
+
+    def setUp(self):
+        super().setUp()
+        self.state = StateStore()
+
+    def tearDown(self):
+        self.state.close()
+        super().tearDown()
+
+    def test_round_uses_each_response_once(self):
+        responses = [f"response {number}" for number in range(20)]
+        self.write_responses(responses)
+        pool = ResponsePool(self.state, seed=1)
+
+        first_round = [pool.next() for _ in responses]
+        second_round = [pool.next() for _ in responses]
+        self.assertEqual(sorted(first_round), sorted(responses))
+        self.assertEqual(sorted(second_round), sorted(responses))
+        self.assertNotEqual(first_round, second_round)  # Each round has a new order
+
+    def test_no_repeat_across_edits(self):
+        responses = [f"response {number}" for number in range(20)]
+        self.write_responses(responses)
+        pool = ResponsePool(self.state, seed=2)
+        used = [pool.next() for _ in range(8)]
+
+        # Remove an unused response, and add new ones
+        unused = [response for response in responses if response not in used]
+        edited = [response for response in responses if response != unused[0]] + [f"new {number}" for number in range(5)]
+        self.write_responses(edited)
+
+        # Until the round ends, no response is repeated
+        seen = set(used)
+        while True:
+            response = pool.next()
+            if response in seen:
+                break
+            seen.add(response)
+        self.assertNotIn(unused[0], seen)
+        self.assertTrue(all(response in seen for response in unused[1:]))
+
+    def test_order_is_shared_through_the_state(self):
+        self.write_responses(["a", "b", "c", "d"])
+        pool = ResponsePool(self.state, seed=3)
+        other = ResponsePool(self.state, seed=3)     # (e.g. another bot process)
+        taken = [pool.next(), other.next(), pool.next(), other.next()]
+        self.assertEqual(sorted(taken), ["a", "b", "c", "d"])
+
+    def test_new_round_when_the_rest_was_removed(self):
+        self.write_responses(["a", "b", "c"])
+        pool = ResponsePool(self.state, seed=4)
+        used = [pool.next(), pool.next()]
+
+        # Only the used responses are left: the round is over, and the next response starts a new one
+        self.write_responses(used)
+        round_start = self.state.get("responses")["seed"]
+        self.assertIn(pool.next(), used)
+        self.assertNotEqual(self.state.get("responses")["seed"], round_start)
+
+    def test_no_responses(self):
+        self.write_responses([])
+        pool = ResponsePool(self.state, seed=5)
+        with self.assertRaises(ValueError):
+            pool.next()
+
+    def test_imported_queue_comes_first(self):
+        self.write_responses(["a", "b"])
+        pool = ResponsePool(self.state, seed=6)
+        pool.import_queue(["old 1", "old 2"])
+        taken = [pool.next() for _ in range(4)]
+        self.assertEqual(taken[:2], ["old 2", "old 1"])     # (the old queue was used from its end)
+        self.assertEqual(sorted(taken[2:]), ["a", "b"])
+        self.assertNotIn("queue", self.state.get("responses"))
+
+    def test_same_seed_same_order(self):
+        self.write_responses([f"response {number}" for number in range(10)])
+        orders = []
+        for state_file in ("first.db", "second.db"):
+            state = StateStore(state_file)
+            pool = ResponsePool(state, seed=7)
+            orders.append([pool.next() for _ in range(10)])
+            state.close()
+        self.assertEqual(orders[0], orders[1])
+
+class OldQueueTest(BotTestCase):
+
+    def restart_with_temp_file(self, data):
+        """Start the bot again, with the given contents on the 'temp.bin' file of older versions."""
+
+        self.bot.close()
+        Path("temp.bin").write_bytes(data)
+        self.bot = self.new_bot()
+        return self.bot.responses[self.bot.rules[0].responses]
+
+    def test_temp_file_is_imported(self):
+        pool = self.restart_with_temp_file(pickle.dumps(deque(["old 1", "old 2"])))
+        self.assertEqual([pool.next(), pool.next()], ["old 2", "old 1"])
+        self.assertFalse(Path("temp.bin").exists())
+
+    def test_truncated_temp_file_is_discarded(self):
+        data = pickle.dumps(deque(["old 1", "old 2"]))
+        pool = self.restart_with_temp_file(data[:len(data) // 2])
+        self.assertNotIn(pool.next(), ("old 1", "old 2"))
+        self.assertFalse(Path("temp.bin").exists())
+
+    def test_queue_on_the_state_is_imported(self):
+        self.bot.state.set(responses=["old 1", "old 2"])
+        self.bot.close()
+        self.bot = self.new_bot()
+        pool = self.bot.responses[self.bot.rules[0].responses]
+        self.assertEqual([pool.next(), pool.next()], ["old 2", "old 1"])
+        self.assertIsNone(self.bot.state.get("responses"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Tests of the retries of the operations that fail because of a temporary problem (see 'chickenretry')."""
+
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from random import Random
+from prawcore.exceptions import RequestException
+from chickenmetrics import Metrics
+from chickenretry import RetryPolicy
+from testsupport import FolderTestCase
+
+class RetryPolicyTest(FolderTestCase):
+
+    def failing(self, failures, error):
+        """Function that raises an error on its first calls."""
+
+        calls = []
+        def function():
+            calls.append(self.clock.time())
+            if len(calls) <= failures:
+                raise error
+            return "done"
+        return function, calls
+
+    def test_retries_temporary_errors(self):
+        metrics = Metrics()
+        policy = RetryPolicy(attempts=4, base_delay=5, metrics=metrics, rng=Random(0))
+        function, calls = self.failing(2, RequestException(ConnectionError(), (), {}))
+        with redirect_stdout(StringIO()):
+            self.assertEqual(policy.call(function, "search"), "done")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(metrics.get("chickenbot_retries_total", operation="search"), 2)
+
+        # The waits are jittered, between half and all of the exponential delay
+        waits = [later - earlier for earlier, later in zip(calls, calls[1:])]
+        self.assertTrue(2.5 <= waits[0] <= 5)
+        self.assertTrue(5 <= waits[1] <= 10)
+
+    def test_gives_up_after_the_last_attempt(self):
+        policy = RetryPolicy(attempts=3, rng=Random(0))
+        function, calls = self.failing(5, RequestException(ConnectionError(), (), {}))
+        with redirect_stdout(StringIO()), self.assertRaises(RequestException):
+            policy.call(function)
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self):
+        policy = RetryPolicy(rng=Random(0))
+        function, calls = self.failing(1, ValueError())
+        with self.assertRaises(ValueError):
+            policy.call(function)
+        self.assertEqual(len(calls), 1)
+
+    def test_delay_is_capped(self):
+        policy = RetryPolicy(base_delay=5, max_delay=60, rng=Random(0))
+        self.assertTrue(all(30 <= policy.delay(retry) <= 60 for retry in range(5, 20)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests of the rules of the questions answered by the bot (see 'chickenrules')."""
+
+import json
+import unittest
+from pathlib import Path
+from chickenrules import Rule, RuleMatcher, build_queries, load_rules
+from testsupport import FolderTestCase
+
+class RuleMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = [
+            Rule("chicken", "why did the chicken cross the road"),
+            Rule("duck", "why did the duck cross the road"),
+            Rule("chicken_twice", "why did the chicken cross the road twice"),
+        ]
+        self.matcher = RuleMatcher(self.rules)
+
+    def test_match(self):
+        self.assertIs(self.matcher.match("Why did the DUCK cross the road?"), self.rules[1])
+        self.assertIsNone(self.matcher.match("Why did the chicken cross the street?"))
+
+    def test_longer_question_takes_precedence(self):
+        self.assertIs(self.matcher.match("So, why did the chicken cross the road twice?"), self.rules[2])
+        self.assertIs(self.matcher.match("Why did the chicken cross the road?"), self.rules[0])
+
+    def test_first_question_on_the_title(self):
+        title = "Why did the duck cross the road, and why did the chicken cross the road?"
+        self.assertIs(self.matcher.match(title), self.rules[1])
+
+class RulesFileTest(FolderTestCase):
+
+    def test_default_rule(self):
+        rules = load_rules("rules.json", "why did the chicken cross the road")
+        self.assertEqual([rule.name for rule in rules], ["chicken"])
+        self.assertEqual(rules[0].responses, "responses.txt")
+
+    def test_rules_file(self):
+        Path("rules.json").write_text(json.dumps([
+            {"name": "chicken", "question": "Why did the chicken cross the road"},
+            {"name": "duck", "question": "why did the duck cross the road", "responses": "ducks.txt", "cooldown": 60},
+        ]), encoding="utf-8")
+        chicken, duck = load_rules("rules.json", "unused")
+        self.assertEqual(chicken.question, "why did the chicken cross the road")
+        self.assertEqual(chicken.header, ">Why did the chicken cross the road?")
+        self.assertEqual((duck.responses, duck.cooldown), ("ducks.txt", 60))
+
+    def test_repeated_names(self):
+        Path("rules.json").write_text(json.dumps([{"name": "same", "question": "a"}, {"name": "same", "question": "b"}]), encoding="utf-8")
+        with self.assertRaises(ValueError):
+            load_rules("rules.json", "unused")
+
+class QueriesTest(unittest.TestCase):
+
+    def test_queries_are_merged_within_the_length(self):
+        rules = [Rule(f"rule{number}", f"question number {number}") for number in range(30)]
+        queries = build_queries(rules, max_length=200)
+
+        self.assertGreater(len(queries), 1)
+        self.assertTrue(all(len(query) <= 200 for query in queries))
+        self.assertEqual(" OR ".join(queries), " OR ".join(rule.query for rule in rules))   # (every rule, in order)
+
+if __name__ == "__main__":
+    unittest.main()
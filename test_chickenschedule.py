@@ -0,0 +1,50 @@
+"""Tests of the wait time between searches (see 'chickenschedule')."""
+
+import unittest
+from chickenschedule import PollScheduler
+from testsupport import FolderTestCase
+
+class PollSchedulerTest(FolderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock.advance_to(self.clock.time() // 3600 * 3600 + 86400 + 1800)     # (at the middle of an hour)
+        self.now = self.clock.time()
+        self.scheduler = PollScheduler()
+
+    def test_no_data(self):
+        self.assertEqual(self.scheduler.next_interval(), 3600)
+
+    def test_clustered_posts(self):
+        self.scheduler.record_hits([self.now - minutes * 60 for minutes in range(10)])
+        self.assertAlmostEqual(self.scheduler.next_interval(), 720)
+
+        # The wait is never shorter than the minimum
+        self.scheduler.record_hits([self.now - seconds for seconds in range(100)])
+        self.assertEqual(self.scheduler.next_interval(), 600)
+
+    def test_busy_hour_of_the_day(self):
+        # Two posts at this hour on each of the past week's days
+        self.scheduler.record_hits([self.now - days * 86400 + offset for days in range(1, 8) for offset in (0, 600)])
+        self.assertAlmostEqual(self.scheduler.next_interval(), 5400)
+
+    def test_quiet_period(self):
+        self.scheduler.record_hits([self.now - 5 * 86400 + 12 * 3600])    # (at another hour of the day)
+        self.assertEqual(self.scheduler.next_interval(), 7200)
+
+    def test_old_posts_are_forgotten(self):
+        self.scheduler.record_hits([self.now - 15 * 86400, self.now - 600])
+        self.assertEqual(list(self.scheduler.arrivals), [self.now - 600])
+        self.clock.sleep(14 * 86400)
+        self.assertEqual(self.scheduler.next_interval(), 3600)
+
+    def test_rate_limit(self):
+        self.scheduler.record_hits([self.now - minutes * 60 for minutes in range(10)])
+        interval = self.scheduler.next_interval()
+        self.assertAlmostEqual(self.scheduler.next_interval({"remaining": 50, "reset_timestamp": self.now + 5000}), interval)
+        self.assertAlmostEqual(self.scheduler.next_interval({"remaining": 5, "reset_timestamp": self.now + 300}), interval)
+        self.assertEqual(self.scheduler.next_interval({"remaining": 5, "reset_timestamp": self.now + 5000}), 5000)
+        self.assertEqual(self.scheduler.next_interval({"remaining": None, "reset_timestamp": None}), interval)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Tests of the saved state shared by the bot processes (see 'chickenstate')."""
+
+import json
+import unittest
+from pathlib import Path
+from threading import Barrier, Thread
+from chickenlog import log_signature, read_replies
+from chickenstate import StateStore
+from testsupport import BotTestCase, FolderTestCase
+
+class ClaimTest(FolderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stores = [StateStore() for _ in range(4)]  # (one connection for each bot process)
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        super().tearDown()
+
+    def claim_at_once(self, claims):
+        """Make the claims at the same time, each one from its own thread and connection.
+        Returns whether each claim succeeded."""
+
+        barrier = Barrier(len(claims))
+        results = [None] * len(claims)
+        def claim(number, store, submission, user_id):
+            barrier.wait()
+            results[number] = store.claim(submission, user_id, f"worker{number}", cooldown=3600)
+        threads = [Thread(target=claim, args=(number, *arguments)) for number, arguments in enumerate(claims)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_post_is_claimed_once(self):
+        for attempt in range(10):
+            results = self.claim_at_once([(store, f"t3_post{attempt}", f"user{attempt}") for store in self.stores])
+            self.assertEqual(results.count(True), 1)
+
+    def test_author_is_claimed_once(self):
+        for attempt in range(10):
+            results = self.claim_at_once([(store, f"t3_post{attempt}_{number}", f"user{attempt}") for number, store in enumerate(self.stores)])
+            self.assertEqual(results.count(True), 1)
+
+    def test_released_author_can_be_claimed_again(self):
+        store = self.stores[0]
+        self.assertTrue(store.claim("t3_first", "user", "worker", cooldown=3600))
+        self.assertFalse(store.claim("t3_second", "user", "worker", cooldown=3600))
+        store.release_author("t3_first")
+        self.assertTrue(store.claim("t3_second", "user", "worker", cooldown=3600))
+        self.assertFalse(store.claim("t3_first", "other", "worker", cooldown=3600))
+
+def write_log(path, records):
+    """Append reply records to a log, as (time, subreddit)."""
+
+    with open(path, "a", encoding="utf-8") as log_file:
+        for reply_time, subreddit in records:
+            log_file.write(json.dumps({"time": reply_time, "kind": "reply", "subreddit": subreddit}) + "\n")
+
+class CounterTest(FolderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.state = StateStore()
+        Path("chickenbot_log.txt").write_text(     # (log of older versions: time, user, link to the comment)
+            "2020-01-01 10:00:00\tsomeone\thttps://reddit.com/r/old/comments/a/b/c/\n"
+            "\n"
+            "2020-01-02 10:00:00\tother\thttps://reddit.com/r/old/comments/d/e/f/\n",
+            encoding="utf-8"
+        )
+        write_log("chickenbot_log.jsonl", [("2024-01-01 10:00:00", "sub1"), ("2024-01-01 11:00:00", "sub1"), ("2024-01-02 10:00:00", "sub2")])
+        write_log("chickenbot_log_1.jsonl", [("2024-01-02 12:00:00", "sub2")])
+        self.logs = ["chickenbot_log.jsonl", "chickenbot_log_1.jsonl"]
+
+    def tearDown(self):
+        self.state.close()
+        super().tearDown()
+
+    def rebuild(self, counter_start=0):
+        signatures = {path: log_signature(path) for path in self.logs}
+        return self.state.rebuild_reply_stats(read_replies(self.logs), counter_start, signatures)
+
+    def test_rebuild(self):
+        self.assertEqual(self.rebuild(counter_start=10), 16)
+        self.assertEqual(self.state.get("reply_counter"), 16)
+        self.assertEqual(self.state.reply_stats(), [
+            ("2020-01-01", "old", 1), ("2020-01-02", "old", 1),
+            ("2024-01-01", "sub1", 2), ("2024-01-02", "sub2", 2),
+        ])
+
+    def test_rebuild_replaces_the_old_stats(self):
+        self.rebuild()
+        Path("chickenbot_log.txt").unlink()
+        self.assertEqual(self.rebuild(), 4)
+        self.assertEqual(len(self.state.reply_stats()), 2)
+
+    def test_counter_in_sync(self):
+        self.assertFalse(self.state.counter_in_sync({path: log_signature(path) for path in self.logs}))
+        self.rebuild()
+        self.assertTrue(self.state.counter_in_sync({path: log_signature(path) for path in self.logs}))
+
+        # A log changed by something else than the bot
+        write_log("chickenbot_log_1.jsonl", [("2024-01-03 10:00:00", "sub3")])
+        self.assertFalse(self.state.counter_in_sync({path: log_signature(path) for path in self.logs}))
+
+    def test_log_written_by_the_bot_keeps_the_counter_in_sync(self):
+        self.rebuild()
+        write_log("chickenbot_log.jsonl", [("2024-01-03 10:00:00", "sub3")])
+        self.state.record_log_signature("chickenbot_log.jsonl", log_signature("chickenbot_log.jsonl"))
+        self.assertTrue(self.state.counter_in_sync({path: log_signature(path) for path in self.logs}))
+
+class SavedCounterTest(BotTestCase):
+
+    def test_counter_is_counted_from_the_logs_once(self):
+        self.quietly(self.bot.make_reply, self.new_submission("poster"))
+        self.bot.close()
+        counter = self.bot.reply_counter
+
+        # Read from the state while the logs are unchanged, and recounted when they change
+        self.bot = self.new_bot()
+        self.assertEqual(self.bot.reply_counter, counter)
+        self.bot.close()
+        write_log(self.bot.log_file_name, [("2024-01-01 10:00:00", "sub1")])
+        self.bot = self.new_bot()
+        self.assertEqual(self.bot.reply_counter, counter + 1)
+
+    def test_legacy_log_is_counted(self):
+        Path("chickenbot_log.txt").write_text("2020-01-01 10:00:00\tsomeone\thttps://reddit.com/r/old/comments/a/b/c/\n", encoding="utf-8")
+        bot = self.new_bot(state_file="new_state.db")
+        try:
+            self.assertEqual(bot.reply_counter, self.bot.reply_counter + 1)
+            self.assertIn(("2020-01-01", "old", 1), bot.state.reply_stats())
+        finally:
+            bot.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Base classes of the tests (see the 'test_*.py' modules), which run offline.
+
+'FolderTestCase' runs each test on its own temporary folder, with a virtual clock.
+'BotTestCase' also starts the bot on a fake Reddit (see 'fakereddit')."""
+
+import chickenbot
+import chickenclock
+import shutil
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from os import chdir, getcwd
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import time
+from chickenclock import VirtualClock, set_clock
+from chickenmetrics import Metrics, CountingRequestor
+from fakereddit import FakeReddit
+
+SOURCE = Path(__file__).resolve().parent
+
+class FolderTestCase(unittest.TestCase):
+    """Runs each test on its own temporary folder (so the bot's files do not mix with the real ones),
+    with a virtual clock that starts at the current time."""
+
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.previous_folder = getcwd()
+        chdir(self.folder.name)
+        self.clock = VirtualClock(time())
+        set_clock(self.clock)
+
+    def tearDown(self):
+        set_clock(chickenclock.SystemClock())
+        chdir(self.previous_folder)
+        self.folder.cleanup()
+
+class BotTestCase(unittest.TestCase):
+    """Runs the bot against the fake Reddit, on a temporary folder with the bot's text files.
+    The bot's fixed pauses are skipped, and its retries do not wait."""
+
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.previous_folder = getcwd()
+        for file_name in ("responses.txt", "blacklist.txt"):
+            shutil.copy(SOURCE / file_name, self.folder.name)
+        chdir(self.folder.name)
+        self.previous_sleep = chickenbot.sleep
+        chickenbot.sleep = lambda seconds: None
+
+        self.fake = FakeReddit()
+        self.fake.seed(posts=100, history=20, messages=10, replies=10)
+        self.metrics = Metrics()
+        self.bot = self.new_bot()
+
+    def tearDown(self):
+        self.bot.close()
+        self.fake.close()
+        chickenbot.sleep = self.previous_sleep
+        chdir(self.previous_folder)
+        self.folder.cleanup()
+
+    def new_bot(self, **settings):
+        """Start a bot on the fake Reddit (on the same state as the previous one)."""
+
+        reddit = self.fake.reddit(requestor_class=CountingRequestor, requestor_kwargs={"metrics": self.metrics})
+        settings = {"metrics_file": None, "heartbeat_file": None, "retry_delay": 0, "seed": 0, **settings}
+        with redirect_stdout(StringIO()):
+            return chickenbot.ChickenBot(reddit=reddit, metrics=self.metrics, **settings)
+
+    def quietly(self, function, *args):
+        """Run a function without showing what it prints."""
+
+        with redirect_stdout(StringIO()):
+            return function(*args)
+
+    def new_submission(self, author, subreddit="sub1", title="Why did the chicken cross the road?"):
+        """Add a post to the fake Reddit, and get it as the bot gets it."""
+
+        post = self.fake.add_submission(title, author, subreddit, time())
+        submission = self.bot.reddit.submission(post["id"])
+        submission._fetch()
+        return submission